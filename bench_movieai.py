@@ -0,0 +1,325 @@
+"""Offline benchmarks for the media recommendation engine.
+
+Starts a local stand-in for the TMDb API with canned responses and a
+configurable per-request latency, points movieai.BASE_URL at it, loads a
+synthetic history of each requested size and times the main engine paths.
+Results are written as JSON Lines, one record per benchmark and size, so
+runs can be compared over time.
+
+    python bench_movieai.py --sizes 10 1000 100000 --latency-ms 20 --output bench.jsonl
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import movieai
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+DEFAULT_REPEAT = 5
+DEFAULT_LATENCY_MS = 20
+
+MOVIE_GENRES = [(28, "Action"), (12, "Adventure"), (16, "Animation"), (35, "Comedy"), (80, "Crime"),
+                (18, "Drama"), (14, "Fantasy"), (27, "Horror"), (10749, "Romance"), (878, "Science Fiction")]
+TV_GENRES = [(10759, "Action & Adventure"), (16, "Animation"), (35, "Comedy"), (80, "Crime"),
+             (18, "Drama"), (10765, "Sci-Fi & Fantasy"), (9648, "Mystery")]
+
+def _stable_id(text):
+    return sum((i + 1) * ord(ch) for i, ch in enumerate(text)) % 900000 + 1000
+
+def _listing(media_type, seed, count=20):
+    """A page of list results (search, discover, popular, recommendations)"""
+    genres = MOVIE_GENRES if media_type == "movie" else TV_GENRES
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        item_id = seed * 31 + i
+        item = {
+            "id": item_id,
+            "overview": f"Synthetic {media_type} {item_id}.",
+            "vote_average": round(rng.uniform(4, 9), 1),
+            "popularity": round(rng.uniform(1, 500), 2),
+            "genre_ids": [g[0] for g in rng.sample(genres, 2)],
+        }
+        if media_type == "movie":
+            item.update(title=f"Bench Movie {item_id}", release_date=f"{rng.randint(1960, 2024)}-01-01")
+        else:
+            item.update(name=f"Bench Show {item_id}", first_air_date=f"{rng.randint(1960, 2024)}-01-01")
+        items.append(item)
+    return {"page": 1, "results": items, "total_pages": 1}
+
+def _details(media_type, item_id):
+    genres = MOVIE_GENRES if media_type == "movie" else TV_GENRES
+    rng = random.Random(item_id)
+    details = {
+        "id": item_id,
+        "overview": f"Synthetic {media_type} {item_id}.",
+        "vote_average": round(rng.uniform(4, 9), 1),
+        "vote_count": rng.randint(10, 20000),
+        "popularity": round(rng.uniform(1, 500), 2),
+        "genres": [{"id": gid, "name": name} for gid, name in rng.sample(genres, 2)],
+        "credits": {
+            "cast": [{"name": f"Actor {rng.randint(1, 500)}"} for _ in range(8)],
+            "crew": [{"name": f"Director {rng.randint(1, 100)}", "job": "Director"}]
+        },
+        "recommendations": _listing(media_type, item_id, 10),
+    }
+    if media_type == "movie":
+        details.update(title=f"Bench Movie {item_id}", release_date=f"{rng.randint(1960, 2024)}-01-01")
+    else:
+        details.update(name=f"Bench Show {item_id}", first_air_date=f"{rng.randint(1960, 2024)}-01-01",
+                       number_of_seasons=rng.randint(1, 10))
+    return details
+
+def fake_tmdb_response(path, params):
+    """Return the canned payload for a TMDb path, or None for an unknown route"""
+    if path in ("/genre/movie/list", "/genre/tv/list"):
+        genres = MOVIE_GENRES if "movie" in path else TV_GENRES
+        return {"genres": [{"id": gid, "name": name} for gid, name in genres]}
+    match = re.fullmatch(r"/search/(movie|tv|person)", path)
+    if match:
+        query = params.get("query", "")
+        if match.group(1) == "person":
+            return {"results": [{"id": _stable_id(query), "name": query.title()}]}
+        return _listing(match.group(1), _stable_id(query), 5)
+    match = re.fullmatch(r"/(movie|tv)/popular", path)
+    if match:
+        return _listing(match.group(1), 7, 20)
+    match = re.fullmatch(r"/discover/(movie|tv)", path)
+    if match:
+        return _listing(match.group(1), _stable_id(params.get("with_genres", "")), 20)
+    match = re.fullmatch(r"/person/(\d+)/movie_credits", path)
+    if match:
+        credits = _listing("movie", int(match.group(1)), 20)["results"]
+        return {"cast": credits, "crew": [dict(item, job="Director") for item in credits[:5]]}
+    match = re.fullmatch(r"/(movie|tv)/(\d+)", path)
+    if match:
+        return _details(match.group(1), int(match.group(2)))
+    return None
+
+class FakeTMDbHandler(BaseHTTPRequestHandler):
+    """Serves fake_tmdb_response() after sleeping for the server's latency"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        time.sleep(self.server.latency)
+        self.server.requests += 1
+        payload = fake_tmdb_response(url.path, params)
+        body = json.dumps(payload if payload is not None else {"status_message": "Not found"}).encode()
+        self.send_response(200 if payload is not None else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeTMDbServer:
+    """Local TMDb stand-in running on a background thread"""
+
+    def __init__(self, latency_ms=DEFAULT_LATENCY_MS):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeTMDbHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency_ms / 1000
+        self.httpd.requests = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def write_synthetic_history(path, size, seed=0):
+    """Write a snapshot with `size` movies and shows, their features and a watch history"""
+    rng = random.Random(seed)
+    state = movieai.initialize_data()
+    for gid, name in MOVIE_GENRES:
+        state["genre_cache"][f"movie_{gid}"] = name
+    for gid, name in TV_GENRES:
+        state["genre_cache"][f"tv_{gid}"] = name
+
+    for i in range(size):
+        media_type = "movie" if i % 2 == 0 else "tv"
+        genres = MOVIE_GENRES if media_type == "movie" else TV_GENRES
+        picked = rng.sample(genres, 2)
+        title = f"Synthetic {'Movie' if media_type == 'movie' else 'Show'} {i}"
+        catalog = state["movies"] if media_type == "movie" else state["tv_shows"]
+        catalog[title] = {
+            "title": title,
+            "year": str(rng.randint(1960, 2024)),
+            "rating": round(rng.uniform(4, 9), 1),
+            "genres": [name for _, name in picked],
+            "actors": [f"Actor {rng.randint(1, 500)}" for _ in range(5)],
+            "recommendations": [],
+            "type": media_type
+        }
+        features = {
+            "popularity": rng.uniform(1, 500),
+            "vote_average": rng.uniform(4, 9),
+            "vote_count": rng.randint(10, 20000),
+            "genres": [gid for gid, _ in picked],
+            "year": rng.randint(1960, 2024),
+        }
+        if media_type == "tv":
+            features["seasons"] = rng.randint(1, 10)
+        state["movie_features" if media_type == "movie" else "tv_features"].add(title, features)
+        state["watch_history"].append(title)
+        for _, name in picked:
+            state["preferences"]["movie_genres" if media_type == "movie" else "tv_genres"][name] += 1
+
+    with open(path, "w") as file:
+        json.dump(movieai.serialize_state(state, 0), file)
+
+def _time_calls(func, repeat, setup=None):
+    timings = []
+    for i in range(repeat):
+        if setup:
+            setup(i)
+        start = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def _summary(timings):
+    ordered = sorted(timings)
+    return {
+        "mean_ms": sum(ordered) / len(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p90_ms": ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)],
+        "min_ms": ordered[0],
+        "max_ms": ordered[-1],
+    }
+
+def _invalidate_knn(i):
+    for index in movieai.knn_indexes.values():
+        index.fitted_version = None
+
+def _bump_state(i):
+    movieai.bump_state_version()
+
+def _reset_miner(i):
+    movieai.current_profile().miner.reset()
+
+def knn_recall(store, n_queries=100, k=movieai.KNN_NEIGHBORS, lsh_params=None, seed=0):
+    """Compare LSH neighbors against exact KNN on a feature store: recall@k and timings"""
+    features = store.matrix()
+    features = (features - features.mean(axis=0)) / (features.std(axis=0) + 1e-10)
+    k = min(k, len(features) - 1)
+    queries = random.Random(seed).sample(range(len(features)), min(n_queries, len(features)))
+
+    exact = movieai.ExactBackend()
+    start = time.perf_counter()
+    exact.fit(features)
+    exact_fit = time.perf_counter() - start
+    lsh = movieai.LSHBackend(**(lsh_params or {}))
+    start = time.perf_counter()
+    lsh.fit(features)
+    lsh_fit = time.perf_counter() - start
+
+    hits = 0
+    exact_time = lsh_time = 0.0
+    for row in queries:
+        start = time.perf_counter()
+        _, expected = exact.kneighbors(features[row:row + 1], k + 1)
+        exact_time += time.perf_counter() - start
+        start = time.perf_counter()
+        _, found = lsh.kneighbors(features[row:row + 1], k + 1)
+        lsh_time += time.perf_counter() - start
+        expected = {int(i) for i in expected[0] if i != row}
+        found = {int(i) for i in found[0] if i != row}
+        hits += len(expected & found) / max(len(expected), 1)
+
+    return {
+        "recall_at_k": hits / len(queries),
+        "k": k,
+        "queries": len(queries),
+        "exact_fit_ms": exact_fit * 1000,
+        "lsh_fit_ms": lsh_fit * 1000,
+        "exact_query_ms": exact_time / len(queries) * 1000,
+        "lsh_query_ms": lsh_time / len(queries) * 1000,
+        "lsh_insert_ms": lsh_fit / len(features) * 1000,
+    }
+
+def run_benchmarks(sizes, repeat, latency_ms, workdir, lsh_params=None):
+    """Yield one result record per benchmark and history size"""
+    with FakeTMDbServer(latency_ms) as server:
+        movieai.BASE_URL = server.url
+        movieai.set_response_cache(None)
+        for size in sizes:
+            snapshot = os.path.join(workdir, f"history_{size}.json")
+            write_synthetic_history(snapshot, size)
+            movieai.init_engine(data_file=snapshot)
+            movieai.cache_genres()
+
+            benchmarks = [
+                ("search_movie", lambda i: movieai.search_movie(f"bench movie query {size} {i}"), None),
+                ("search_tv_show", lambda i: movieai.search_tv_show(f"bench show query {size} {i}"), None),
+                ("get_personalized_recommendations", lambda i: movieai.get_personalized_recommendations(), _bump_state),
+                ("get_personalized_recommendations_memo", lambda i: movieai.get_personalized_recommendations(), None),
+                ("update_association_rules_cold", lambda i: movieai.update_association_rules(), _reset_miner),
+                ("update_association_rules_warm", lambda i: movieai.update_association_rules(), None),
+                ("build_knn_model_cold", lambda i: movieai.build_knn_model("movie"), _invalidate_knn),
+                ("build_knn_model_warm", lambda i: movieai.build_knn_model("movie"), None),
+            ]
+            for name, func, setup in benchmarks:
+                requests_before = server.httpd.requests
+                with redirect_stdout(io.StringIO()):
+                    timings = _time_calls(func, repeat, setup)
+                record = {"benchmark": name, "size": size, "repeat": repeat, "latency_ms": latency_ms}
+                record.update(_summary(timings))
+                record["api_calls_per_run"] = (server.httpd.requests - requests_before) / repeat
+                yield record
+
+            store = movieai.history_data["movie_features"]
+            if len(store) > movieai.KNN_NEIGHBORS:
+                record = {"benchmark": "knn_lsh_recall", "size": size, "lsh": dict(lsh_params or {})}
+                record.update(knn_recall(store, lsh_params=lsh_params))
+                yield record
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for movieai")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="synthetic history sizes (number of titles)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per benchmark")
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS,
+                        help="latency the fake TMDb server adds to every request")
+    parser.add_argument("--output", default="-", help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--lsh-tables", type=int, default=movieai.LSH_TABLES, help="LSH hash tables")
+    parser.add_argument("--lsh-hashes", type=int, default=movieai.LSH_HASHES, help="LSH hashes per table")
+    parser.add_argument("--lsh-bucket-width", type=float, default=movieai.LSH_BUCKET_WIDTH, help="LSH bucket width")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            lsh_params = {"n_tables": args.lsh_tables, "n_hashes": args.lsh_hashes,
+                          "bucket_width": args.lsh_bucket_width}
+            for record in run_benchmarks(args.sizes, args.repeat, args.latency_ms, workdir, lsh_params):
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == "__main__":
+    main()
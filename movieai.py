@@ -1,14 +1,21 @@
-import requests
+import argparse
+import asyncio
+import contextvars
 import json
+import math
 import os
+import re
+import sys
 import time
-from collections import defaultdict
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict, OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlencode
+from contextlib import contextmanager, nullcontext, redirect_stdout
 from functools import wraps
-import numpy as np
-from sklearn.neighbors import NearestNeighbors
-import pandas as pd
-from mlxtend.preprocessing import TransactionEncoder
-from mlxtend.frequent_patterns import apriori, association_rules
 from datetime import datetime, timezone
 
 # Constants
@@ -16,16 +23,361 @@ TMDB_API_KEY = "bc6dddace4cdc07f1fc2f980d3e5d707"
 DATA_FILE = "media_history.json"
 BASE_URL = "https://api.themoviedb.org/3"
 MAX_RETRIES = 3
-RETRY_DELAY = 1  # seconds
+RETRY_DELAY = 1  # seconds, doubled on every retry
+RETRY_DELAY_CAP = 16  # seconds
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_PER_SECOND = 40  # TMDb allows roughly 50 requests/s per IP
+RATE_LIMIT_BURST = 20
+CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failed requests before the circuit opens
+CIRCUIT_RESET_SECONDS = 30
 KNN_NEIGHBORS = 5
+KNN_BACKEND = "exact"  # "exact" (sklearn) or "lsh" (approximate, incremental)
+# LSH recall/speed knobs: more tables or wider buckets raise recall, more hashes per table raise speed
+LSH_TABLES = 8
+LSH_HASHES = 4
+LSH_BUCKET_WIDTH = 2.0
+NEIGHBOR_TABLE_K = 10  # neighbors precomputed per title by --build-neighbors
+NEIGHBOR_CHUNK_SIZE = 2048  # rows per process pool task
 MIN_SUPPORT = 0.1
 MIN_CONFIDENCE = 0.5
+MOVIE_FEATURE_COLUMNS = ["popularity", "vote_average", "vote_count", "year"]
+TV_FEATURE_COLUMNS = ["popularity", "vote_average", "vote_count", "year", "seasons"]
+INTEGER_FEATURES = {"vote_count", "year", "seasons"}
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+IMPORT_TIME_BUDGET = 0.25  # seconds
+BATCH_CONCURRENCY = 8
+INGEST_CHUNK_SIZE = 1000  # records per process pool task
+RECOMMENDATION_MEMO_ENTRIES = 256
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_WORKERS = 16
+SERVE_SAVE_INTERVAL = 5  # seconds between batched journal writes in --serve mode
+DEFAULT_USER = "default"
+PROFILE_DIR = "profiles"
+MAX_LOADED_PROFILES = 64
+PROFILE_IDLE_SECONDS = 15 * 60
+PROFILE_EVICT_INTERVAL = 60  # seconds between idle sweeps when no profile is being loaded
+TRACE_ENV_VAR = "MOVIEAI_TRACE"  # "trace" for per-request traces, "histogram" for aggregates
+FUZZY_MAX_EDITS = 2  # typos tolerated by a local title lookup...
+FUZZY_EDIT_RATIO = 0.15  # ...and at most this share of the query's length
+FUZZY_MIN_LENGTH = 4  # shorter queries only match exactly
+RESPONSE_CACHE_FILE = "tmdb_cache.sqlite"
+RESPONSE_CACHE_MEMORY_ENTRIES = 512
+RESPONSE_CACHE_DISK_ENTRIES = 20000
+RESPONSE_CACHE_LOW_WATER = 0.9  # an eviction sweep trims the disk cache to this share of its bound
+RESPONSE_CACHE_ACCESS_BATCH = 100  # disk hits whose access times are written in one transaction
+# Seconds a cached TMDb response stays fresh; the first matching prefix wins
+RESPONSE_CACHE_TTLS = [
+    ("/genre/", 7 * 24 * 3600),
+    ("/movie/popular", 6 * 3600),
+    ("/tv/popular", 6 * 3600),
+    ("/discover/", 6 * 3600),
+    ("/search/", 24 * 3600),
+    ("/person/", 24 * 3600),
+    ("/movie/", 24 * 3600),
+    ("/tv/", 24 * 3600),
+]
+RESPONSE_CACHE_DEFAULT_TTL = 3600
+NEGATIVE_CACHE_TTL = 6 * 3600  # seconds a search that found nothing is remembered
+NEGATIVE_CACHE_ENTRIES = 4096
+HTTP_POOL_SIZE = 10
+MAX_RESULT_PAGES = 5  # deepest discover/popular page read to fill a list after exclusions
+PREFETCH_ENV_VAR = "MOVIEAI_PREFETCH"  # set to enable the recommendation prefetcher
+PREFETCH_CONCURRENCY = 2
+PREFETCH_RATE_PER_SECOND = 4  # prefetch budget, on top of the shared rate limiter
+MAX_CONCURRENT_REQUESTS = 6
+
+class Instrumentation:
+    """Stage timers and counters for the recommendation path.
+
+    mode is None (disabled), "trace" (print one JSON trace per request to
+    stderr) or "histogram" (aggregate per-stage latency histograms and
+    counters, see report()). When disabled, stage() hands back a shared
+    no-op context manager and count() returns immediately.
+    """
+
+    _NULL_STAGE = nullcontext()
+
+    def __init__(self, mode=None):
+        self.mode = mode or None
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(lambda: defaultdict(int))
+        self.totals = defaultdict(float)
+        self._lock = threading.Lock()
+        self._trace = contextvars.ContextVar("movieai_trace", default=None)
+
+    def stage(self, name):
+        """Context manager timing one stage"""
+        if self.mode is None:
+            return self._NULL_STAGE
+        return _TimedStage(self, name)
+
+    def count(self, name, amount=1):
+        if self.mode is None:
+            return
+        with self._lock:
+            self.counters[name] += amount
+        trace = self._trace.get()
+        if trace is not None:
+            trace["counters"][name] = trace["counters"].get(name, 0) + amount
+
+    @contextmanager
+    def request(self, name):
+        """Group the stages of one user-facing call into a trace"""
+        if self.mode is None or self._trace.get() is not None:
+            with self.stage(name):
+                yield
+            return
+        trace = {"request": name, "stages": [], "counters": {}}
+        token = self._trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._trace.reset(token)
+            self.record(name, elapsed_ms)
+            if self.mode == "trace":
+                trace["total_ms"] = round(elapsed_ms, 3)
+                print(json.dumps(trace), file=sys.stderr)
+
+    def record(self, name, elapsed_ms):
+        bucket = 0 if elapsed_ms < 1 else int(math.log2(elapsed_ms)) + 1
+        with self._lock:
+            self.histograms[name][bucket] += 1
+            self.totals[name] += elapsed_ms
+        trace = self._trace.get()
+        if trace is not None:
+            trace["stages"].append({"stage": name, "ms": round(elapsed_ms, 3)})
+
+    def report(self):
+        """Aggregate histograms (bucket upper bounds in ms) and counters"""
+        with self._lock:
+            stages = {}
+            for name, buckets in self.histograms.items():
+                calls = sum(buckets.values())
+                stages[name] = {
+                    "calls": calls,
+                    "mean_ms": self.totals[name] / calls,
+                    "histogram_ms": {f"<{2 ** bucket}": buckets[bucket] for bucket in sorted(buckets)}
+                }
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def traced(self, name):
+        """Decorator running a function as one traced request"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.mode is None:
+                    return func(*args, **kwargs)
+                with self.request(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.totals.clear()
+
+class _TimedStage:
+    __slots__ = ("instrumentation", "name", "start")
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instrumentation.record(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+instrumentation = Instrumentation(os.environ.get(TRACE_ENV_VAR))
+
+def endpoint_label(endpoint):
+    """Collapse ids in an endpoint so calls are counted per route"""
+    return re.sub(r"/\d+", "/{id}", endpoint)
+
+class FeatureStore:
+    """Columnar feature store backed by a single growable NumPy buffer.
+
+    Each row holds the fixed numeric columns followed by a one-hot genre
+    block. Row and column capacity double on demand, so appends are
+    amortized O(1), and matrix() returns a view for the KNN code. Rows added
+    before the matrix is first needed are queued, so loading history does
+    not import NumPy.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.titles = []
+        self.rows = {}
+        self.genre_ids = []
+        self.genre_columns = {}
+        self.version = 0
+        # Rows written since the KNN index last synced, so it can catch up incrementally
+        self.dirty_rows = set()
+        self._data = None
+        self._pending = {}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __contains__(self, title):
+        return title in self.rows
+
+    def __iter__(self):
+        return iter(list(self.titles))
+
+    def __getitem__(self, title):
+        return self._row_to_dict(self.rows[title])
+
+    def __setitem__(self, title, features):
+        self.add(title, features)
+
+    def items(self):
+        for row, title in enumerate(list(self.titles)):
+            yield title, self._row_to_dict(row)
+
+    def _row_to_dict(self, row):
+        features = {}
+        if self._data is None:
+            pending = self._pending[row]
+            for name in self.columns:
+                value = pending.get(name) or 0
+                features[name] = int(value) if name in INTEGER_FEATURES else float(value)
+            features["genres"] = list(pending.get("genres", []))
+            return features
+
+        values = self._data[row]
+        for col, name in enumerate(self.columns):
+            features[name] = int(values[col]) if name in INTEGER_FEATURES else float(values[col])
+        offset = len(self.columns)
+        features["genres"] = [gid for i, gid in enumerate(self.genre_ids) if values[offset + i]]
+        return features
+
+    def _materialize(self):
+        """Allocate the buffer on first use and move queued rows into it"""
+        if self._data is None:
+            import numpy as np
+            self._data = np.zeros((max(16, len(self.titles)), len(self.columns) + max(8, len(self.genre_ids))))
+            pending, self._pending = self._pending, {}
+            for row in sorted(pending):
+                self._write_row(row, pending[row])
+        return self._data
+
+    def _genre_column(self, genre_id):
+        """Return the buffer column for a genre id, growing the vocabulary if needed"""
+        import numpy as np
+        idx = self.genre_columns.get(genre_id)
+        if idx is None:
+            idx = len(self.genre_ids)
+            self.genre_ids.append(genre_id)
+            self.genre_columns[genre_id] = idx
+            needed = len(self.columns) + len(self.genre_ids)
+            while needed > self._data.shape[1]:
+                grown = np.zeros((self._data.shape[0], self._data.shape[1] * 2))
+                grown[:, :self._data.shape[1]] = self._data
+                self._data = grown
+        return len(self.columns) + idx
+
+    def _write_row(self, row, features):
+        import numpy as np
+        if row >= self._data.shape[0]:
+            grown = np.zeros((max(self._data.shape[0] * 2, row + 1), self._data.shape[1]))
+            grown[:self._data.shape[0]] = self._data
+            self._data = grown
+
+        genre_cols = [self._genre_column(gid) for gid in features.get("genres", [])]
+        values = self._data[row]
+        values[:] = 0
+        for col, name in enumerate(self.columns):
+            values[col] = features.get(name) or 0
+        values[genre_cols] = 1
+
+    def register_genres(self, genre_ids):
+        """Reserve columns for genre ids not seen yet, in the given order"""
+        for genre_id in genre_ids:
+            if genre_id in self.genre_columns:
+                continue
+            if self._data is None:
+                self.genre_columns[genre_id] = len(self.genre_ids)
+                self.genre_ids.append(genre_id)
+            else:
+                self._genre_column(genre_id)
+            self.version += 1
+
+    def add(self, title, features):
+        """Insert or replace the feature row for a title"""
+        row = self.rows.get(title)
+        if row is None:
+            row = len(self.titles)
+            self.rows[title] = row
+            self.titles.append(title)
+
+        if self._data is None:
+            self._pending[row] = features
+        else:
+            self._write_row(row, features)
+        self.dirty_rows.add(row)
+        self.version += 1
+
+    def take_dirty_rows(self):
+        """Return the rows written since the last call, sorted, and forget them"""
+        rows, self.dirty_rows = sorted(self.dirty_rows), set()
+        return rows
+
+    def matrix(self):
+        """Return the live (rows x features) matrix as a view of the buffer"""
+        data = self._materialize()
+        return data[:len(self.titles), :len(self.columns) + len(self.genre_ids)]
+
+    def copy(self):
+        """Return a detached copy (one buffer copy, no per-row work)"""
+        store = FeatureStore(self.columns)
+        store.titles = list(self.titles)
+        store.rows = dict(self.rows)
+        store.genre_ids = list(self.genre_ids)
+        store.genre_columns = dict(self.genre_columns)
+        store.version = self.version
+        store._data = None if self._data is None else self._data.copy()
+        store._pending = dict(self._pending)
+        return store
+
+    def to_json(self):
+        """Serialize to a compact columnar structure"""
+        rows = [self._row_to_dict(row) for row in range(len(self.titles))]
+        return {
+            "columns": self.columns,
+            "titles": self.titles,
+            "values": [[row[name] for name in self.columns] for row in rows],
+            "genres": [row["genres"] for row in rows]
+        }
+
+    @classmethod
+    def from_json(cls, data, columns):
+        """Load from to_json() output or from the legacy per-title dict format"""
+        store = cls(columns)
+        if not data:
+            return store
+        if "titles" in data and "values" in data:
+            for title, values, genres in zip(data["titles"], data["values"], data["genres"]):
+                features = dict(zip(data["columns"], values))
+                features["genres"] = genres
+                store.add(title, features)
+        else:
+            for title, features in data.items():
+                store.add(title, features)
+        return store
 
 # Initialize data structure
-def initialize_data():
-    data = {
-        "movies": {},
-        "tv_shows": {},
+def initialize_profile():
+    """Per-user state: watch history, preference counters and mined rules"""
+    return {
         "watch_history": [],
         "preferences": {
             "movie_genres": defaultdict(int),
@@ -33,102 +385,1241 @@ def initialize_data():
             "actors": defaultdict(int),
             "directors": defaultdict(int)
         },
+        "association_rules": []
+    }
+
+def initialize_data():
+    data = {
+        "movies": {},
+        "tv_shows": {},
+        # Recommended titles shared by every catalog entry, keyed by media_key()
+        "media_table": {},
         "genre_cache": {},
-        "movie_features": {},
-        "tv_features": {},
-        "association_rules": [],
+        "movie_features": FeatureStore(MOVIE_FEATURE_COLUMNS),
+        "tv_features": FeatureStore(TV_FEATURE_COLUMNS),
         "updated_at": datetime.now(timezone.utc)
     }
+    # The main data file also holds the default user's profile
+    data.update(initialize_profile())
     return data
 
-# Load or create media history
-try:
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as file:
-            history_data = json.load(file)
+def load_snapshot(path, initial_state=initialize_data):
+    """Load a snapshot file written by serialize_state (or an older full save)"""
+    with open(path, "r") as file:
+        data = json.load(file)
+    state = initial_state()
+    for key in state:
+        if key not in data:
+            continue
+        if key == "preferences":
             # Convert back to defaultdicts
-            history_data["preferences"]["movie_genres"] = defaultdict(int, history_data["preferences"].get("movie_genres", {}))
-            history_data["preferences"]["tv_genres"] = defaultdict(int, history_data["preferences"].get("tv_genres", {}))
-            history_data["preferences"]["actors"] = defaultdict(int, history_data["preferences"].get("actors", {}))
-            history_data["preferences"]["directors"] = defaultdict(int, history_data["preferences"].get("directors", {}))
-            history_data["genre_cache"] = history_data.get("genre_cache", {})
-            history_data["movie_features"] = history_data.get("movie_features", {})
-            history_data["tv_features"] = history_data.get("tv_features", {})
-            history_data["association_rules"] = history_data.get("association_rules", [])
+            for category in state["preferences"]:
+                state["preferences"][category].update(data["preferences"].get(category, {}))
+        elif key == "movie_features":
+            state[key] = FeatureStore.from_json(data[key], MOVIE_FEATURE_COLUMNS)
+        elif key == "tv_features":
+            state[key] = FeatureStore.from_json(data[key], TV_FEATURE_COLUMNS)
+        else:
+            state[key] = data[key]
+    if "media_table" in state:
+        for catalog in ("movies", "tv_shows"):
+            for title, record in state[catalog].items():
+                state[catalog][title] = normalize_media_record(state, record)
+    state["journal_seq"] = data.get("journal_seq", 0)
+    return state
+
+def media_key(item):
+    """Media table key for a formatted title: its TMDb id, or its title when it has none"""
+    if item.get("id"):
+        return f"{item.get('type', 'movie')}:{item['id']}"
+    return f"{item.get('type', 'movie')}:{item.get('title', '')}"
+
+def normalize_media_record(state, record):
+    """Move a catalog record's embedded recommendations into the media table.
+
+    Returns the record with its recommendations replaced by media table
+    keys; records that already hold keys are returned unchanged.
+    """
+    recommendations = record.get("recommendations")
+    if not recommendations or all(isinstance(rec, str) for rec in recommendations):
+        return record
+    keys = []
+    for rec in recommendations:
+        if isinstance(rec, dict):
+            key = media_key(rec)
+            state["media_table"][key] = rec
+            rec = key
+        keys.append(rec)
+    return dict(record, recommendations=keys)
+
+def copy_state(state):
+    """Shallow-copy a state so it can be serialized while the original keeps changing.
+
+    Catalog records and rule lists are replaced rather than edited in place,
+    so copying the containers that hold them is enough.
+    """
+    copied = {}
+    for key, value in state.items():
+        if key == "preferences":
+            copied[key] = {category: dict(counts) for category, counts in value.items()}
+        elif isinstance(value, FeatureStore):
+            copied[key] = value.copy()
+        elif isinstance(value, (dict, list)):
+            copied[key] = type(value)(value)
+        else:
+            copied[key] = value
+    return copied
+
+def serialize_state(state, journal_seq):
+    """Build the JSON-ready snapshot of a full state or a profile shard"""
+    data = {}
+    for key, value in state.items():
+        if key == "preferences":
+            data[key] = {category: dict(counts) for category, counts in value.items()}
+        elif key in ("movie_features", "tv_features"):
+            data[key] = value.to_json()
+        elif key != "updated_at":
+            data[key] = value
+    data["journal_seq"] = journal_seq
+    data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    return data
+
+def apply_mutation(state, op, payload):
+    """Apply one journaled mutation to a state dict"""
+    if op == "media":
+        catalog = "movies" if payload["media_type"] == "movie" else "tv_shows"
+        state[catalog][payload["title"]] = normalize_media_record(state, payload["data"])
+    elif op == "features":
+        feature_key = "movie_features" if payload["media_type"] == "movie" else "tv_features"
+        state[feature_key].add(payload["title"], payload["features"])
+    elif op == "watch":
+        state["watch_history"].append(payload["title"])
+    elif op == "preferences":
+        for category, deltas in payload["deltas"].items():
+            for name, delta in deltas.items():
+                state["preferences"][category][name] += delta
+    elif op == "genres":
+        state["genre_cache"].update(payload["genres"])
+    elif op == "rules":
+        state["association_rules"] = payload["rules"]
     else:
-        history_data = initialize_data()
-except (json.JSONDecodeError, KeyError, Exception) as e:
-    print(f"Error loading data file: {str(e)}. Initializing new data structure.")
-    history_data = initialize_data()
+        raise ValueError(f"Unknown journal operation: {op}")
+
+class JournalStore:
+    """Snapshot file plus an append-only journal of mutations.
+
+    Each mutation is appended to the journal as one JSON line, so saving
+    costs O(change) rather than O(state). When the journal grows past
+    JOURNAL_COMPACT_BYTES it is rotated and folded into a fresh snapshot on
+    a background thread, which also does the serialization from a copy of
+    the state taken at rotation time. Entries carry sequence numbers and the snapshot
+    records the last one it contains, so replaying a rotated journal that
+    was already compacted is harmless. Mutations are applied and appended
+    under state_lock, so compaction takes it too (always before self.lock)
+    to snapshot a state that matches its sequence number.
+    """
+
+    def __init__(self, snapshot_path, initial_state=initialize_data):
+        self.snapshot_path = snapshot_path
+        self.journal_path = os.path.splitext(snapshot_path)[0] + ".journal"
+        self.initial_state = initial_state
+        self.state = None
+        self.seq = 0
+        self.pending = []
+        self.lock = threading.RLock()
+        self.compactor = None
+
+    def _journal_files(self):
+        """Rotated journals awaiting compaction (oldest first), then the live one"""
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        prefix = os.path.basename(self.journal_path) + "."
+        rotated = []
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(".compacting"):
+                seq = name[len(prefix):-len(".compacting")]
+                if seq.isdigit():
+                    rotated.append((int(seq), os.path.join(directory, name)))
+        return [path for _, path in sorted(rotated)] + [self.journal_path]
+
+    def load(self):
+        """Rebuild state from the snapshot plus every journal entry newer than it"""
+        if os.path.exists(self.snapshot_path):
+            state = load_snapshot(self.snapshot_path, self.initial_state)
+        else:
+            state = self.initial_state()
+        self.seq = state.pop("journal_seq", 0)
+        for path in self._journal_files():
+            if not os.path.exists(path):
+                continue
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Skipping unreadable journal entry in {path}")
+                        continue
+                    if entry["seq"] > self.seq:
+                        apply_mutation(state, entry["op"], entry["data"])
+                        self.seq = entry["seq"]
+        self.state = state
+        return state
+
+    def append(self, op, payload):
+        with self.lock:
+            self.seq += 1
+            self.pending.append(json.dumps({"seq": self.seq, "op": op, "data": payload}))
+
+    def _write_pending(self):
+        if self.pending:
+            with open(self.journal_path, "a") as file:
+                file.write("\n".join(self.pending) + "\n")
+            self.pending = []
+
+    def flush(self):
+        """Write pending mutations to the journal, compacting it once it gets large"""
+        with self.lock:
+            self._write_pending()
+            oversized = os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > JOURNAL_COMPACT_BYTES
+        if oversized:
+            self.compact()
+
+    def compact(self, background=True):
+        """Fold the journal into a new snapshot"""
+        with state_lock, self.lock:
+            if self.compactor is not None and self.compactor.is_alive():
+                if background:
+                    return
+                self.compactor.join()
+            self._write_pending()
+            state = copy_state(self.state)
+            if os.path.exists(self.journal_path):
+                os.replace(self.journal_path, f"{self.journal_path}.{self.seq}.compacting")
+            self.compactor = threading.Thread(target=self._write_snapshot, args=(state, self.seq))
+            self.compactor.start()
+        if not background:
+            self.compactor.join()
+
+    def _write_snapshot(self, state, seq):
+        try:
+            snapshot = json.dumps(serialize_state(state, seq))
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w") as file:
+                file.write(snapshot)
+            os.replace(tmp_path, self.snapshot_path)
+            for path in self._journal_files()[:-1]:
+                if int(path.rsplit(".", 2)[-2]) <= seq:
+                    os.remove(path)
+        except Exception as e:
+            print(f"Error compacting data: {str(e)}")
+
+def normalize_title(title):
+    """Normalize a title for lookups: case-folded, accents and punctuation removed, single-spaced"""
+    text = unicodedata.normalize("NFKD", title).casefold()
+    text = "".join(ch if ch.isalnum() else " " for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.split())
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10}
+
+def _title_numbers(key):
+    """Numbers in a normalized title, with roman numerals (up to xxxix) as integers"""
+    numbers = []
+    for token in key.split():
+        if token.isdigit():
+            numbers.append(int(token))
+        elif re.fullmatch(r"x{0,3}(ix|iv|v?i{0,3})", token):
+            total = 0
+            for i, ch in enumerate(token):
+                value = _ROMAN_VALUES[ch]
+                total += -value if i + 1 < len(token) and _ROMAN_VALUES[token[i + 1]] > value else value
+            numbers.append(total)
+    return numbers
+
+def _edit_distance(a, b, limit):
+    """Edit distance (with adjacent transpositions) between a and b, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+class TitleIndex:
+    """Lookup index over stored titles.
+
+    Exact hits go through a hash of normalized keys. Near misses are found
+    through a trigram inverted index: a title within k edits of the query
+    (a swap of adjacent letters counting as one) differs in at most 4k
+    trigrams, which prunes the candidates
+    before their edit distance is checked. A candidate is accepted within
+    FUZZY_MAX_EDITS edits (and FUZZY_EDIT_RATIO of the query's length) when
+    it contains the same numbers, roman numerals included, so a query for a
+    film never resolves to its sequel and a title never to a longer one.
+    """
+
+    def __init__(self, titles=()):
+        self.exact = {}
+        self.grams = {}
+        self.postings = defaultdict(set)
+        self.lock = threading.Lock()
+        for title in titles:
+            self.add(title)
+
+    def add(self, title):
+        key = normalize_title(title)
+        if not key:
+            return
+        grams = _trigrams(key)
+        with self.lock:
+            if key in self.exact:
+                return
+            self.exact[key] = title
+            self.grams[key] = grams
+            for gram in grams:
+                self.postings[gram].add(key)
+
+    def lookup(self, query, max_edits=FUZZY_MAX_EDITS):
+        """Return the stored title matching query exactly or within a few typos, or None"""
+        key = normalize_title(query)
+        if not key:
+            return None
+        with self.lock:
+            if key in self.exact:
+                return self.exact[key]
+        if len(key) < FUZZY_MIN_LENGTH:
+            return None
+
+        limit = min(max_edits, max(1, int(len(key) * FUZZY_EDIT_RATIO)))
+        grams = _trigrams(key)
+        numbers = _title_numbers(key)
+        with self.lock:
+            overlaps = defaultdict(int)
+            for gram in grams:
+                for candidate in self.postings.get(gram, ()):
+                    overlaps[candidate] += 1
+            candidates = [(candidate, overlap) for candidate, overlap in overlaps.items()
+                          if overlap >= max(len(grams), len(self.grams[candidate])) - 4 * limit]
+
+        best, best_rank = None, None
+        for candidate, overlap in candidates:
+            if abs(len(candidate) - len(key)) > limit or _title_numbers(candidate) != numbers:
+                continue
+            distance = _edit_distance(key, candidate, limit)
+            if distance <= limit and (best_rank is None or (distance, -overlap) < best_rank):
+                best, best_rank = candidate, (distance, -overlap)
+        return self.exact[best] if best is not None else None
+
+class GenreRegistry:
+    """Genre lookups per media type, built from genre_cache.
+
+    Holds id -> name, lowercased name -> id and id -> feature column maps,
+    so every genre lookup is a dict access. Columns are assigned in id
+    order when the registry is built, and new genres are appended, so the
+    KNN feature layout does not depend on the order titles were watched.
+    """
+
+    def __init__(self, genre_cache=None):
+        self.names = {"movie": {}, "tv": {}}
+        self.ids = {"movie": {}, "tv": {}}
+        self.columns = {"movie": {}, "tv": {}}
+        self.update(genre_cache or {})
+
+    def update(self, genre_cache):
+        """Add genre_cache style entries ({"movie_28": "Action", ...})"""
+        entries = []
+        for key, name in genre_cache.items():
+            media_type, _, gid = key.partition("_")
+            if media_type in self.names and gid.isdigit():
+                entries.append((media_type, int(gid), name))
+        for media_type, gid, name in sorted(entries):
+            self.names[media_type][gid] = name
+            self.ids[media_type][name.lower()] = gid
+            self.columns[media_type].setdefault(gid, len(self.columns[media_type]))
+
+    def name(self, genre_id, media_type="movie"):
+        return self.names[media_type].get(int(genre_id))
+
+    def names_for(self, genre_ids, media_type="movie"):
+        """Names of the known genres among genre_ids, in order"""
+        names = self.names[media_type]
+        return [names[int(gid)] for gid in genre_ids if int(gid) in names]
+
+    def id_for(self, name, media_type="movie"):
+        return self.ids[media_type].get(name.lower())
+
+    def ids_for(self, names, media_type="movie"):
+        """Ids of the known genres among names, in order"""
+        ids = self.ids[media_type]
+        return [ids[name.lower()] for name in names if name.lower() in ids]
+
+    def column_order(self, media_type="movie"):
+        """Genre ids in feature column order"""
+        columns = self.columns[media_type]
+        return sorted(columns, key=columns.get)
+
+PROFILE_KEYS = ("watch_history", "preferences", "association_rules")
+PROFILE_OPS = {"watch", "preferences", "rules"}
+
+class UserProfile:
+    """One user's state shard with its own journal and association miner"""
+
+    def __init__(self, user_id, state, journal):
+        self.user_id = user_id
+        self.state = state
+        self.journal = journal
+        self.miner = AssociationMiner()
+        self.active = 0
+        self.last_used = time.monotonic()
+
+class ProfileManager:
+    """Lazily loaded per-user profile shards with idle and LRU eviction.
+
+    The default user's profile lives inside the main data file, so existing
+    histories keep working. Every other user gets a snapshot plus journal
+    under profiles/. A shard is loaded on first use and flushed and dropped
+    once it has been idle for PROFILE_IDLE_SECONDS or when more than
+    MAX_LOADED_PROFILES are resident. Profiles in use are never evicted.
+    Eviction runs when a shard is loaded and at most every
+    PROFILE_EVICT_INTERVAL seconds otherwise.
+    """
+
+    def __init__(self, directory, max_loaded=MAX_LOADED_PROFILES, idle_seconds=PROFILE_IDLE_SECONDS,
+                 evict_interval=PROFILE_EVICT_INTERVAL):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self.evict_interval = evict_interval
+        self.last_evicted = time.monotonic()
+        self.profiles = OrderedDict()
+        self.lock = threading.RLock()
+
+    def add_default(self, state, journal):
+        with self.lock:
+            self.profiles[DEFAULT_USER] = UserProfile(DEFAULT_USER, state, journal)
+
+    def get(self, user_id):
+        """Return the loaded profile for user_id, loading its shard if needed"""
+        with self.lock:
+            now = time.monotonic()
+            profile = self.profiles.get(user_id)
+            due = profile is None or now - self.last_evicted >= self.evict_interval
+            if profile is None:
+                if not re.fullmatch(r"[A-Za-z0-9_.-]+", user_id) or user_id.startswith("."):
+                    raise ValueError(f"Invalid user id: {user_id}")
+                os.makedirs(self.directory, exist_ok=True)
+                shard = JournalStore(os.path.join(self.directory, f"{user_id}.json"), initialize_profile)
+                try:
+                    state = shard.load()
+                except Exception as e:
+                    print(f"Error loading profile {user_id}: {str(e)}. Starting a new profile.")
+                    state = initialize_profile()
+                    shard.state = state
+                profile = UserProfile(user_id, state, shard)
+                self.profiles[user_id] = profile
+            profile.last_used = now
+            self.profiles.move_to_end(user_id)
+        if due:
+            self.evict(keep=user_id)
+        return profile
+
+    def evict(self, keep=None):
+        """Flush and drop idle profiles, then the least recently used beyond the limit"""
+        # A flush may compact, which takes state_lock; it must be acquired before self.lock
+        with state_lock, self.lock:
+            now = time.monotonic()
+            self.last_evicted = now
+            loaded = len(self.profiles)
+            for user_id, profile in list(self.profiles.items()):
+                if user_id in (DEFAULT_USER, keep) or profile.active:
+                    continue
+                if loaded > self.max_loaded or now - profile.last_used > self.idle_seconds:
+                    profile.journal.flush()
+                    del self.profiles[user_id]
+                    loaded -= 1
+
+    def flush(self):
+        with self.lock:
+            profiles = list(self.profiles.values())
+        for profile in profiles:
+            profile.journal.flush()
+
+    def compact(self):
+        with self.lock:
+            profiles = list(self.profiles.values())
+        for profile in profiles:
+            profile.journal.compact(background=False)
+
+class HistoryView(MutableMapping):
+    """history_data: the shared catalog plus the current user's profile keys"""
+
+    def __init__(self, shared):
+        self.shared = shared
+
+    def _target(self, key):
+        return current_profile().state if key in PROFILE_KEYS else self.shared
+
+    def __getitem__(self, key):
+        return self._target(key)[key]
+
+    def __setitem__(self, key, value):
+        self._target(key)[key] = value
+
+    def __delitem__(self, key):
+        del self._target(key)[key]
+
+    def __iter__(self):
+        return iter(self.shared)
+
+    def __len__(self):
+        return len(self.shared)
 
-def save_data():
-    """Save data to file with proper serialization"""
+# Engine state, populated by init_engine()
+history_data = HistoryView(initialize_data())
+journal = JournalStore(DATA_FILE)
+profiles = ProfileManager(PROFILE_DIR)
+title_indexes = {"movie": TitleIndex(), "tv": TitleIndex()}
+genre_registry = GenreRegistry()
+_current_user = contextvars.ContextVar("movieai_user", default=DEFAULT_USER)
+# The profile use_profile() resolved for the current context, so reads skip the manager
+_current_profile = contextvars.ContextVar("movieai_profile", default=None)
+_engine_ready = False
+_engine_lock = threading.RLock()
+# Guards multi-step updates of history_data and the models derived from it
+state_lock = threading.RLock()
+_save_deferrals = 0
+# Bumped by every mutation; memoized recommendations are keyed on it
+state_version = 0
+
+def init_engine(data_file=None):
+    """Load the catalog and default profile (snapshot plus journal) and build the lookup indexes.
+
+    Safe to call repeatedly; only the first call (or one naming a different
+    data_file) does any work. history_data keeps its identity so existing
+    references to it stay valid.
+    """
+    global DATA_FILE, journal, profiles, genre_registry, _engine_ready, state_version
+    if _engine_ready and data_file is None:
+        return history_data
+    with _engine_lock:
+        if _engine_ready and (data_file is None or data_file == DATA_FILE):
+            return history_data
+        if data_file is not None:
+            DATA_FILE = data_file
+
+        journal = JournalStore(DATA_FILE)
+        try:
+            state = journal.load()
+        except (json.JSONDecodeError, KeyError, Exception) as e:
+            print(f"Error loading data file: {str(e)}. Initializing new data structure.")
+            state = initialize_data()
+            journal.state = state
+        history_data.shared = state
+
+        profiles = ProfileManager(os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)), PROFILE_DIR))
+        profiles.add_default(state, journal)
+        title_indexes["movie"] = TitleIndex(state["movies"])
+        title_indexes["tv"] = TitleIndex(state["tv_shows"])
+        genre_registry = GenreRegistry(state["genre_cache"])
+        register_feature_genres(state)
+        state_version += 1
+        _engine_ready = True
+        return history_data
+
+def current_profile():
+    """Return the profile of the user the current context is acting for"""
+    profile = _current_profile.get()
+    if profile is not None:
+        return profile
+    init_engine()
+    return profiles.get(_current_user.get())
+
+@contextmanager
+def use_profile(user_id):
+    """Run the enclosed block on behalf of user_id (None keeps the current user)"""
+    init_engine()
+    profile = profiles.get(_current_user.get() if user_id is None else user_id)
+    with profiles.lock:
+        profile.active += 1
+    token = _current_user.set(profile.user_id)
+    profile_token = _current_profile.set(profile)
     try:
-        data_to_save = {
-            "movies": history_data["movies"],
-            "tv_shows": history_data["tv_shows"],
-            "watch_history": history_data["watch_history"],
-            "preferences": {
-                "movie_genres": dict(history_data["preferences"]["movie_genres"]),
-                "tv_genres": dict(history_data["preferences"]["tv_genres"]),
-                "actors": dict(history_data["preferences"]["actors"]),
-                "directors": dict(history_data["preferences"]["directors"])
-            },
-            "genre_cache": history_data["genre_cache"],
-            "movie_features": history_data["movie_features"],
-            "tv_features": history_data["tv_features"],
-            "association_rules": history_data["association_rules"],
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
-        with open(DATA_FILE, "w") as file:
-            json.dump(data_to_save, file, indent=4)
+        yield profile
+    finally:
+        _current_profile.reset(profile_token)
+        _current_user.reset(token)
+        with profiles.lock:
+            profile.active -= 1
+            profile.last_used = time.monotonic()
+
+def record_mutation(op, **payload):
+    """Apply a mutation to history_data and queue it for the matching journal"""
+    global state_version
+    init_engine()
+    with state_lock:
+        state_version += 1
+        if op in PROFILE_OPS:
+            profile = current_profile()
+            apply_mutation(profile.state, op, payload)
+            profile.journal.append(op, payload)
+        else:
+            apply_mutation(history_data.shared, op, payload)
+            journal.append(op, payload)
+            if op == "media":
+                title_indexes[payload["media_type"]].add(payload["title"])
+            elif op == "genres":
+                genre_registry.update(payload["genres"])
+                register_feature_genres(history_data.shared)
+
+def bump_state_version():
+    """Invalidate memoized results after changing state outside record_mutation"""
+    global state_version
+    with state_lock:
+        state_version += 1
+
+class MemoCache:
+    """Bounded LRU of results keyed on their arguments and the state version.
+
+    Every mutation bumps state_version, so entries from an older version
+    can never be returned; they simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries=RECOMMENDATION_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, *parts):
+        return (state_version, _current_user.get()) + parts
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return list(self.entries[key])
+        return None
+
+    def put(self, key, result):
+        if not result:
+            return
+        with self.lock:
+            self.entries[key] = list(result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+recommendation_memo = MemoCache()
+# Flags of the innermost fallback-tracking block; shared with fan_out threads through copied contexts
+_fallback_flags = contextvars.ContextVar("movieai_fallback_flags", default=None)
+
+def mark_degraded():
+    """Flag the result being built as a fallback or error result, so it is not memoized"""
+    flags = _fallback_flags.get()
+    if flags is not None:
+        flags["degraded"] = True
+
+@contextmanager
+def tracking_fallbacks():
+    """Collect mark_degraded() calls made while the block runs, passing them on to any outer block"""
+    flags = {"degraded": False}
+    token = _fallback_flags.set(flags)
+    try:
+        yield flags
+    finally:
+        _fallback_flags.reset(token)
+        if flags["degraded"]:
+            mark_degraded()
+
+def memoized_on_state(key_func):
+    """Decorator memoizing a function's list result per state version and user.
+
+    Results built from fallback data or an error path are returned but not
+    memoized, so the next call retries once the upstream recovers.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = recommendation_memo.key(func.__name__, *key_func(*args, **kwargs))
+            cached = recommendation_memo.get(key)
+            if cached is not None:
+                instrumentation.count(f"memo.hits {func.__name__}")
+                return cached
+            with tracking_fallbacks() as flags:
+                result = func(*args, **kwargs)
+            if not flags["degraded"]:
+                recommendation_memo.put(key, result)
+            return result
+        return wrapper
+    return decorator
+
+def _recommendations_key(details, original_title, media_type="movie"):
+    return media_type, details.get("id") or details.get("title") or details.get("name"), original_title
+
+def register_feature_genres(state):
+    """Give every registered genre its feature store column, in registry order"""
+    state["movie_features"].register_genres(genre_registry.column_order("movie"))
+    state["tv_features"].register_genres(genre_registry.column_order("tv"))
+
+def save_data(force=False):
+    """Persist pending mutations by appending them to the journals"""
+    if _save_deferrals and not force:
+        return
+    try:
+        with instrumentation.stage("save_data"):
+            journal.flush()
+            profiles.flush()
     except Exception as e:
         print(f"Error saving data: {str(e)}")
 
+@contextmanager
+def deferred_saves():
+    """Hold save_data() calls until the outermost block exits, then save once"""
+    global _save_deferrals
+    with state_lock:
+        _save_deferrals += 1
+    try:
+        yield
+    finally:
+        with state_lock:
+            _save_deferrals -= 1
+        save_data()
+
+def compact_data():
+    """Write full snapshots and clear the journals"""
+    try:
+        init_engine()
+        journal.compact(background=False)
+        profiles.compact()
+    except Exception as e:
+        print(f"Error saving data: {str(e)}")
+
+class RateLimiter:
+    """Token bucket shared by every TMDb request.
+
+    Tokens refill at `rate` per second up to `burst`. acquire() blocks the
+    calling thread until a token is available; pause() holds the whole
+    bucket back, e.g. for a Retry-After sent with a 429.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            instrumentation.count("tmdb.rate_limited")
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = max(self.updated, self.paused_until)
+
+class CircuitBreaker:
+    """Stops calling an unhealthy upstream for a while.
+
+    After `threshold` consecutive failures the circuit opens and allow()
+    refuses requests for `reset_seconds`. Then a single trial request is let
+    through (half-open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.reset_seconds else "half-open"
+
+    def allow(self):
+        """Return the state a request may go through in ("closed" or "half-open"), or None"""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return state
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return state
+            return None
+
+    def release_trial(self):
+        """Free the half-open trial slot if its request ended without recording an outcome"""
+        with self.lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial_running:
+                    instrumentation.count("tmdb.circuit_opened")
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+rate_limiter = RateLimiter()
+circuit_breaker = CircuitBreaker()
+
+def retry_after_seconds(response):
+    """Parse a Retry-After header (seconds or an HTTP date) into seconds"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with full jitter; a server-sent Retry-After wins"""
+    if retry_after is not None:
+        return min(retry_after, RETRY_DELAY_CAP)
+    import random
+    return random.uniform(0, min(RETRY_DELAY_CAP, RETRY_DELAY * (2 ** attempt)))
+
 def retry_on_failure(func):
-    """Decorator to retry API calls on failure"""
+    """Decorator to retry API calls on transient failures.
+
+    Only connection errors, timeouts and TRANSIENT_STATUS_CODES are retried,
+    and never sooner than a Retry-After asks; one longer than RETRY_DELAY_CAP
+    makes the call give up at once (a 429 also pauses the shared rate
+    limiter for all of it). Other HTTP errors (404, 401, ...) and unusable responses (bad JSON,
+    redirect loops, broken bodies) give up at once. Every outcome feeds the
+    shared circuit breaker, and nothing is attempted while it is open.
+    Returns None when the call could not be completed.
+    """
     @wraps(func)
     def wrapper(*args, **kwargs):
+        import requests
         for attempt in range(MAX_RETRIES):
+            permit = circuit_breaker.allow()
+            if permit is None:
+                instrumentation.count("tmdb.circuit_rejected")
+                return None
+            retry_after = None
+            settled = False
             try:
-                return func(*args, **kwargs)
-            except (requests.exceptions.RequestException, ConnectionResetError, Exception) as e:
-                print(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY * (attempt + 1))
-                    continue
-                print("Max retries reached. Using fallback data.")
+                result = func(*args, **kwargs)
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in TRANSIENT_STATUS_CODES:
+                    # The upstream answered; this request just can't succeed
+                    circuit_breaker.record_success()
+                    settled = True
+                    print(f"Request failed: {str(e)}")
+                    instrumentation.count("tmdb.permanent_errors")
+                    return None
+                retry_after = retry_after_seconds(e.response)
+                if status == 429:
+                    rate_limiter.pause(retry_after if retry_after is not None else backoff_delay(attempt))
+                circuit_breaker.record_failure()
+                settled = True
+                if retry_after is not None and retry_after > RETRY_DELAY_CAP:
+                    # Retrying within the cap would only be refused again
+                    print(f"Request failed: {str(e)} (retry after {retry_after:.0f}s)")
+                    instrumentation.count("tmdb.gave_up")
+                    return None
+                error = e
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionResetError) as e:
+                circuit_breaker.record_failure()
+                settled = True
+                error = e
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # JSONDecodeError, ChunkedEncodingError, TooManyRedirects, ...: not worth retrying
+                circuit_breaker.record_failure()
+                settled = True
+                print(f"Request failed: {str(e)}")
+                instrumentation.count("tmdb.permanent_errors")
                 return None
+            else:
+                circuit_breaker.record_success()
+                settled = True
+                return result
+            finally:
+                if permit == "half-open" and not settled:
+                    # Whatever escaped must not hold the trial slot forever
+                    circuit_breaker.release_trial()
+
+            print(f"Attempt {attempt + 1} failed: {str(error)}")
+            if attempt < MAX_RETRIES - 1:
+                instrumentation.count("tmdb.retries")
+                time.sleep(backoff_delay(attempt, retry_after))
+                continue
+        print("Max retries reached. Using fallback data.")
+        instrumentation.count("tmdb.gave_up")
+        return None
     return wrapper
 
+class ResponseCache:
+    """TMDb response cache: an in-memory LRU in front of an on-disk SQLite store.
+
+    Entries are keyed on the endpoint plus the sorted request params (the
+    api_key is never part of the key) and expire after a per-endpoint TTL.
+    Both levels are size bounded and evict the least recently used entries.
+    Disk hits only queue their access time; queued times are written with
+    the next store, before an eviction sweep, or once a batch fills up.
+    Pass path=None for a memory-only cache. Cached payloads are shared
+    between callers and must be treated as read-only.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, memory_entries=RESPONSE_CACHE_MEMORY_ENTRIES,
+                 disk_entries=RESPONSE_CACHE_DISK_ENTRIES, ttls=None, default_ttl=RESPONSE_CACHE_DEFAULT_TTL):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttls = RESPONSE_CACHE_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_count = 0
+        self._accessed = {}
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+            self._disk_count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(endpoint, params=None):
+        """Build the cache key for a request, leaving the api_key out"""
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if k != "api_key")
+        return f"{endpoint}?{urlencode(items)}" if items else endpoint
+
+    def ttl_for(self, endpoint):
+        for prefix, ttl in self.ttls:
+            if endpoint.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key, allow_stale=False):
+        """Return a fresh cached payload or None; allow_stale also returns expired ones"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and (allow_stale or entry[1] > now):
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return entry[0]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and (allow_stale or row[1] > now):
+                    self._accessed[key] = now
+                    if len(self._accessed) >= RESPONSE_CACHE_ACCESS_BATCH:
+                        self._write_accessed()
+                        self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, endpoint, value):
+        """Store a payload under the TTL configured for its endpoint"""
+        now = time.time()
+        expires = now + self.ttl_for(endpoint)
+        with self._lock:
+            self._remember(key, value, expires)
+            self.stats["stores"] += 1
+            if self._db is not None:
+                self._accessed.pop(key, None)
+                self._write_accessed()
+                payload = json.dumps(value)
+                cursor = self._db.execute(
+                    "UPDATE responses SET value = ?, expires = ?, accessed = ? WHERE key = ?",
+                    (payload, expires, now, key)
+                )
+                if cursor.rowcount == 0:
+                    self._db.execute(
+                        "INSERT INTO responses (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                        (key, payload, expires, now)
+                    )
+                    self._disk_count += 1
+                if self._disk_count > self.disk_entries:
+                    self._evict_disk(now)
+                self._db.commit()
+
+    def _write_accessed(self):
+        """Write queued access times (the caller commits)"""
+        if self._accessed:
+            self._db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                 [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def _remember(self, key, value, expires):
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self, now):
+        """Drop expired rows, then the least recently used ones down to the low-water mark.
+
+        Trimming below the bound leaves room for many stores before the next
+        sweep, so its cost is amortized over them.
+        """
+        self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - int(self.disk_entries * RESPONSE_CACHE_LOW_WATER)
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)", (excess,)
+            )
+            self.stats["evictions"] += excess
+            count -= excess
+        self._disk_count = count
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._accessed.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+                self._disk_count = 0
+
+_response_cache = None
+_response_cache_configured = False
+
+def set_response_cache(cache):
+    """Install a response cache for get_tmdb_data (None disables caching)"""
+    global _response_cache, _response_cache_configured
+    _response_cache = cache
+    _response_cache_configured = True
+
+def get_response_cache():
+    """Return the active response cache, opening the default one on first use"""
+    global _response_cache, _response_cache_configured
+    if not _response_cache_configured:
+        try:
+            _response_cache = ResponseCache()
+        except sqlite3.Error as e:
+            print(f"Error opening response cache: {str(e)}. Using memory-only cache.")
+            _response_cache = ResponseCache(path=None)
+        _response_cache_configured = True
+    return _response_cache
+
+class NegativeCache:
+    """Remembers searches TMDb answered with no results.
+
+    Keyed on the kind of search (media type, or person role) and the
+    normalized query, with its own TTL and an LRU bound. Only genuine empty
+    answers are stored; failed requests are counted but never cached, so a
+    network problem can't hide a title that exists.
+    """
+
+    def __init__(self, ttl=NEGATIVE_CACHE_TTL, max_entries=NEGATIVE_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "stores": 0, "failures": 0, "calls_saved": 0}
+        self.lock = threading.Lock()
+
+    def contains(self, kind, query):
+        """Whether the search is a remembered miss; a hit counts as one saved API call"""
+        key = (kind, normalize_title(query))
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is None:
+                return False
+            if expires <= time.time():
+                del self.entries[key]
+                return False
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            self.stats["calls_saved"] += 1
+        instrumentation.count("negative_cache.calls_saved")
+        return True
+
+    def add(self, kind, query):
+        key = (kind, normalize_title(query))
+        with self.lock:
+            self.entries[key] = time.time() + self.ttl
+            self.entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def record_failure(self):
+        with self.lock:
+            self.stats["failures"] += 1
+        instrumentation.count("negative_cache.failures")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+negative_cache = NegativeCache()
+
+def search_tmdb(endpoint, query, kind):
+    """Run a TMDb search through the negative cache.
+
+    Returns the results list, which is empty for a genuine (or remembered)
+    miss, or None when the request itself failed.
+    """
+    if negative_cache.contains(kind, query):
+        return []
+    data = get_tmdb_data(endpoint, {"query": query})
+    if data is None:
+        negative_cache.record_failure()
+        return None
+    results = data.get("results") or []
+    if not results:
+        negative_cache.add(kind, query)
+    return results
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Return the shared connection-pooled HTTP session"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+def fan_out(*calls, max_workers=MAX_CONCURRENT_REQUESTS):
+    """Run independent zero-argument callables concurrently and return their results in order"""
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    with ThreadPoolExecutor(max_workers=min(len(calls), max_workers)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, call) for call in calls]
+        return [future.result() for future in futures]
+
 @retry_on_failure
-def get_tmdb_data(endpoint, params=None):
-    """Helper function to get data from TMDb API"""
-    if params is None:
-        params = {}
-    params["api_key"] = TMDB_API_KEY
+def request_tmdb(endpoint, params):
+    """Make one rate-limited TMDb request"""
+    params = dict(params, api_key=TMDB_API_KEY)
     url = f"{BASE_URL}{endpoint}"
-    response = requests.get(url, params=params, timeout=10)
+    rate_limiter.acquire()
+    instrumentation.count(f"tmdb.calls {endpoint_label(endpoint)}")
+    with instrumentation.stage("tmdb.request"):
+        response = get_http_session().get(url, params=params, timeout=10)
     response.raise_for_status()
     return response.json()
 
+def get_tmdb_data(endpoint, params=None):
+    """Helper function to get data from TMDb API.
+
+    Falls back to an expired cached response when the request fails or the
+    circuit breaker is open, and to None when there is nothing cached.
+    Searches with no results are left to the negative cache.
+    """
+    params = dict(params or {})
+    cache = get_response_cache()
+    if cache is not None:
+        cache_key = cache.make_key(endpoint, params)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            instrumentation.count("tmdb.cache_hits")
+            return cached
+
+    data = request_tmdb(endpoint, params)
+    if data is None:
+        mark_degraded()
+    if cache is None:
+        return data
+    if data is None:
+        data = cache.get(cache_key, allow_stale=True)
+        if data is not None:
+            instrumentation.count("tmdb.stale_hits")
+        return data
+    if not (endpoint.startswith("/search/") and not data.get("results")):
+        cache.set(cache_key, endpoint, data)
+    return data
+
 def cache_genres():
     """Cache all available genres from TMDB for both movies and TV"""
+    init_engine()
     try:
         if not history_data["genre_cache"]:
+            movie_data, tv_data = fan_out(
+                lambda: get_tmdb_data("/genre/movie/list"),
+                lambda: get_tmdb_data("/genre/tv/list")
+            )
+
+            genres = {}
+
             # Movie genres
-            movie_data = get_tmdb_data("/genre/movie/list")
             if movie_data and "genres" in movie_data:
                 for g in movie_data["genres"]:
-                    history_data["genre_cache"][f"movie_{g['id']}"] = g["name"]
+                    genres[f"movie_{g['id']}"] = g["name"]
             
             # TV genres
-            tv_data = get_tmdb_data("/genre/tv/list")
             if tv_data and "genres" in tv_data:
                 for g in tv_data["genres"]:
-                    history_data["genre_cache"][f"tv_{g['id']}"] = g["name"]
+                    genres[f"tv_{g['id']}"] = g["name"]
             
-            save_data()
+            if genres:
+                record_mutation("genres", genres=genres)
+                save_data()
     except Exception as e:
         print(f"Error caching genres: {str(e)}")
 
@@ -136,9 +1627,7 @@ def get_genre_names(genre_ids, media_type="movie"):
     """Convert list of genre IDs to genre names"""
     if not genre_ids or not isinstance(genre_ids, list):
         return []
-    prefix = "movie_" if media_type == "movie" else "tv_"
-    return [history_data["genre_cache"].get(f"{prefix}{gid}", "") for gid in genre_ids 
-            if f"{prefix}{gid}" in history_data["genre_cache"]]
+    return genre_registry.names_for(genre_ids, media_type)
 
 def extract_movie_features(movie_details):
     """Extract features for KNN algorithm for movies"""
@@ -171,70 +1660,418 @@ def extract_tv_features(tv_details):
         print(f"Error extracting TV features: {str(e)}")
         return None
 
+class ExactBackend:
+    """Exact nearest neighbors with sklearn; refits on every change"""
+
+    incremental = False
+
+    def fit(self, features):
+        from sklearn.neighbors import NearestNeighbors
+        self.model = NearestNeighbors(n_neighbors=min(KNN_NEIGHBORS, len(features)), algorithm='auto').fit(features)
+
+    def kneighbors(self, vectors, n_neighbors):
+        return self.model.kneighbors(vectors, min(n_neighbors, self.model.n_samples_fit_))
+
+class LSHBackend:
+    """Approximate nearest neighbors with Euclidean (p-stable) LSH.
+
+    Each of n_tables hash tables keys a vector on n_hashes quantized random
+    projections. A query gathers the vectors sharing a bucket with it in
+    any table and ranks those exactly; if that yields too few candidates it
+    falls back to a full scan. Vectors can be inserted or replaced one at a
+    time, and new feature dimensions extend the projections without
+    rehashing existing vectors.
+    """
+
+    incremental = True
+
+    def __init__(self, n_tables=None, n_hashes=None, bucket_width=None, seed=0):
+        import numpy as np
+        self.n_tables = n_tables or LSH_TABLES
+        self.n_hashes = n_hashes or LSH_HASHES
+        self.bucket_width = bucket_width or LSH_BUCKET_WIDTH
+        self.rng = np.random.default_rng(seed)
+        self.projections = np.zeros((self.n_tables * self.n_hashes, 0))
+        self.offsets = self.rng.uniform(0, self.bucket_width, self.n_tables * self.n_hashes)
+        self.data = np.zeros((0, 0))
+        self.size = 0
+        self.tables = [defaultdict(set) for _ in range(self.n_tables)]
+        self.row_keys = {}
+
+    def _grow(self, rows, dims):
+        import numpy as np
+        if dims > self.projections.shape[1]:
+            extra = self.rng.normal(size=(self.projections.shape[0], dims - self.projections.shape[1]))
+            self.projections = np.hstack([self.projections, extra])
+        capacity, width = self.data.shape
+        if rows > capacity or dims > width:
+            grown = np.zeros((max(rows, capacity * 2, 16), max(dims, width)))
+            grown[:capacity, :width] = self.data
+            self.data = grown
+
+    def _keys(self, vectors):
+        import numpy as np
+        dims = vectors.shape[1]
+        hashed = np.floor((vectors @ self.projections[:, :dims].T + self.offsets) / self.bucket_width)
+        hashed = hashed.astype(np.int64).reshape(len(vectors), self.n_tables, self.n_hashes)
+        return [[hashed[i, t].tobytes() for t in range(self.n_tables)] for i in range(len(vectors))]
+
+    def fit(self, features):
+        self.size = 0
+        self.tables = [defaultdict(set) for _ in range(self.n_tables)]
+        self.row_keys = {}
+        self.add(range(len(features)), features)
+
+    def add(self, rows, vectors):
+        """Insert or replace the vectors stored at the given row numbers"""
+        rows = list(rows)
+        if not rows:
+            return
+        self._grow(max(rows) + 1, vectors.shape[1])
+        for row, keys in zip(rows, self._keys(vectors)):
+            for table, key in zip(self.tables, self.row_keys.get(row, ())):
+                table[key].discard(row)
+            for table, key in zip(self.tables, keys):
+                table[key].add(row)
+            self.row_keys[row] = keys
+        self.data[rows, :vectors.shape[1]] = vectors
+        self.size = max(self.size, max(rows) + 1)
+
+    def kneighbors(self, vectors, n_neighbors):
+        import numpy as np
+        n_neighbors = min(n_neighbors, self.size)
+        dims = self.data.shape[1]
+        padded = np.zeros((len(vectors), dims))
+        padded[:, :np.shape(vectors)[1]] = vectors
+        all_distances, all_indices = [], []
+        for vector, keys in zip(padded, self._keys(padded)):
+            candidates = set()
+            for table, key in zip(self.tables, keys):
+                candidates.update(table.get(key, ()))
+            if len(candidates) < n_neighbors:
+                instrumentation.count("knn.lsh_full_scan")
+                candidates = range(self.size)
+            candidates = np.fromiter(candidates, dtype=np.int64)
+            distances = np.linalg.norm(self.data[candidates] - vector, axis=1)
+            order = np.argsort(distances, kind="stable")[:n_neighbors]
+            all_distances.append(distances[order])
+            all_indices.append(candidates[order])
+        return np.array(all_distances), np.array(all_indices)
+
+KNN_BACKENDS = {"exact": ExactBackend, "lsh": LSHBackend}
+
+class KNNIndex:
+    """Long-lived KNN index over the feature store of one media type.
+
+    Features are z-score normalized. Backends that support incremental
+    inserts keep the normalization of their last full fit and only index
+    the rows written since; a full refit happens once the store has doubled
+    in size. Other backends refit whenever the store changes. The index
+    drains its store's dirty rows on every sync, so it must be the store's
+    only incremental consumer.
+    """
+
+    def __init__(self, media_type="movie", backend=None):
+        self.media_type = media_type
+        self.feature_key = "movie_features" if media_type == "movie" else "tv_features"
+        self.backend_name = backend
+        self.store = None
+        self.fitted_version = None
+        self.model = None
+        self.features = None
+
+    def _normalize(self, features):
+        import numpy as np
+        dims = features.shape[1]
+        mean = np.zeros(dims)
+        std = np.ones(dims)
+        known = min(dims, len(self.mean))
+        mean[:known] = self.mean[:known]
+        std[:known] = self.std[:known]
+        return (features - mean) / std
+
+    def sync(self):
+        """Bring the index up to date with the feature store"""
+        store = history_data[self.feature_key]
+        if store is not self.store:
+            self.store = store
+            self.fitted_version = None
+        if self.fitted_version == store.version:
+            return
+        features = store.matrix()
+        backend = KNN_BACKENDS[self.backend_name or KNN_BACKEND]
+        if (self.fitted_version is None or type(self.model) is not backend or not backend.incremental
+                or len(store) >= 2 * self.fitted_rows):
+            with instrumentation.stage("knn.refit"):
+                self.model = backend()
+                self.mean = features.mean(axis=0)
+                self.std = features.std(axis=0) + 1e-10
+                self.features = self._normalize(features)
+                self.model.fit(self.features)
+                self.fitted_rows = len(store)
+                store.take_dirty_rows()
+        else:
+            with instrumentation.stage("knn.insert"):
+                rows = store.take_dirty_rows()
+                self.model.add(rows, self._normalize(features[rows]))
+                self.features = self.model.data[:len(store)]
+        self.fitted_version = store.version
+
+    def neighbors(self, row, n_neighbors):
+        """Return the rows nearest to `row`, excluding itself"""
+        _, indices = self.model.kneighbors(self.features[row:row + 1], n_neighbors + 1)
+        return [int(idx) for idx in indices[0] if idx != row][:n_neighbors]
+
+knn_indexes = {"movie": KNNIndex("movie"), "tv": KNNIndex("tv")}
+
+def store_media_features(title, features, media_type="movie"):
+    """Append extracted features to the feature store"""
+    record_mutation("features", media_type=media_type, title=title, features=features)
+
 def build_knn_model(media_type="movie"):
     """Build KNN model based on media features"""
     try:
         feature_key = "movie_features" if media_type == "movie" else "tv_features"
         if not history_data[feature_key] or len(history_data[feature_key]) < KNN_NEIGHBORS:
             return None
-            
-        # Prepare feature matrix
-        titles = []
-        features = []
-        for title, feat in history_data[feature_key].items():
-            titles.append(title)
-            # Create feature vector: popularity, vote_avg, vote_count, year, and genre flags
-            genre_flags = [0] * len(history_data["genre_cache"])
-            for genre_id in feat["genres"]:
-                cache_key = f"{media_type}_{genre_id}"
-                if cache_key in history_data["genre_cache"]:
-                    idx = list(history_data["genre_cache"].keys()).index(cache_key)
-                    genre_flags[idx] = 1
-            
-            feature_vec = [
-                feat["popularity"],
-                feat["vote_average"],
-                feat["vote_count"],
-                feat["year"],
-                *genre_flags
-            ]
-            
-            # Add seasons for TV shows
-            if media_type == "tv":
-                feature_vec.append(feat["seasons"])
-            
-            features.append(feature_vec)
-        
-        # Normalize features
-        features = np.array(features)
-        features = (features - features.mean(axis=0)) / (features.std(axis=0) + 1e-10)
-        
-        # Build KNN model
-        n_neighbors = min(KNN_NEIGHBORS, len(titles) - 1)
-        model = NearestNeighbors(n_neighbors=n_neighbors, algorithm='auto').fit(features)
-        return model, titles, features
+
+        index = knn_indexes[media_type]
+        with state_lock:
+            index.sync()
+            return index.model, index.store.titles, index.features
     except Exception as e:
         print(f"Error building KNN model: {str(e)}")
         return None
 
+_neighbor_worker = {}
+
+def _init_neighbor_worker(features):
+    """Process pool initializer: fit one exact model per worker over the normalized matrix"""
+    model = ExactBackend()
+    model.fit(features)
+    _neighbor_worker["features"] = features
+    _neighbor_worker["model"] = model
+
+def _neighbor_chunk(start, stop, k):
+    """Top-k neighbors (excluding the row itself) for rows start..stop"""
+    import numpy as np
+    features, model = _neighbor_worker["features"], _neighbor_worker["model"]
+    distances, indices = model.kneighbors(features[start:stop], k + 1)
+    rows = np.arange(start, stop)[:, None]
+    keep = indices != rows
+    # Drop each row's own entry (or the farthest one if the row was not returned)
+    keep[keep.all(axis=1), -1] = False
+    return (start, indices[keep].reshape(stop - start, -1).astype(np.int32),
+            distances[keep].reshape(stop - start, -1).astype(np.float32))
+
+class NeighborTable:
+    """Precomputed top-k neighbors for every title of one media type.
+
+    Built offline (build_neighbor_table / --build-neighbors) and stored as
+    a compressed .npz next to the data file: the titles, a (titles x k)
+    neighbor index array, the matching distances, and the raw features and
+    normalization the table was computed from. Lookups are a dict access
+    plus a row slice. The file is reloaded when it changes on disk.
+    """
+
+    def __init__(self, media_type="movie"):
+        self.media_type = media_type
+        self.path = None
+        self.mtime = None
+        self.titles = []
+        self.rows = {}
+        self.neighbors = None
+        self.distances = None
+        self.features = None
+        self.mean = None
+        self.std = None
+
+    @staticmethod
+    def path_for(media_type):
+        return os.path.splitext(DATA_FILE)[0] + f".{media_type}.neighbors.npz"
+
+    def load(self):
+        """(Re)load the table from disk if the file changed; returns whether one is available"""
+        path = self.path_for(self.media_type)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self.titles, self.rows, self.neighbors = [], {}, None
+            return False
+        if path != self.path or mtime != self.mtime:
+            import numpy as np
+            with np.load(path, allow_pickle=False) as data:
+                self.titles = data["titles"].tolist()
+                self.neighbors = data["neighbors"]
+                self.distances = data["distances"]
+                self.features = data["features"]
+                self.mean = data["mean"]
+                self.std = data["std"]
+            self.rows = {title: row for row, title in enumerate(self.titles)}
+            self.path, self.mtime = path, mtime
+        return True
+
+    def lookup(self, title, n):
+        """Return up to n neighbor titles for title, or None if it is not in the table"""
+        if not self.load() or title not in self.rows:
+            return None
+        return [self.titles[idx] for idx in self.neighbors[self.rows[title], :n]]
+
+    def save(self):
+        import numpy as np
+        path = self.path_for(self.media_type)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, titles=np.array(self.titles, dtype=str), neighbors=self.neighbors,
+                            distances=self.distances, features=self.features, mean=self.mean, std=self.std)
+        os.replace(tmp_path, path)
+        self.path, self.mtime = path, os.stat(path).st_mtime
+
+neighbor_tables = {"movie": NeighborTable("movie"), "tv": NeighborTable("tv")}
+
+def _normalize_with(features, mean, std):
+    import numpy as np
+    dims = features.shape[1]
+    full_mean, full_std = np.zeros(dims), np.ones(dims)
+    full_mean[:min(dims, len(mean))] = mean[:dims]
+    full_std[:min(dims, len(std))] = std[:dims]
+    return (features - full_mean) / full_std
+
+def _compute_neighbors(features, rows, k, workers):
+    """Exact top-k for the given rows against all of features, on a process pool"""
+    import numpy as np
+    neighbors = np.zeros((len(rows), k), dtype=np.int32)
+    distances = np.zeros((len(rows), k), dtype=np.float32)
+    if not len(rows):
+        return neighbors, distances
+    queries = features[rows]
+    # Queried rows go first so _neighbor_chunk can slice them by position
+    order = np.concatenate([rows, np.setdiff1d(np.arange(len(features)), rows)])
+    reordered = features[order]
+    chunks = [(start, min(start + NEIGHBOR_CHUNK_SIZE, len(queries)))
+              for start in range(0, len(queries), NEIGHBOR_CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(chunks)),
+                             initializer=_init_neighbor_worker, initargs=(reordered,)) as executor:
+        for start, chunk_neighbors, chunk_distances in executor.map(
+                _neighbor_chunk, *zip(*[(a, b, k) for a, b in chunks])):
+            neighbors[start:start + len(chunk_neighbors)] = order[chunk_neighbors]
+            distances[start:start + len(chunk_distances)] = chunk_distances
+    return neighbors, distances
+
+def build_neighbor_table(media_type="movie", k=NEIGHBOR_TABLE_K, workers=None, full=False):
+    """Compute or refresh the neighbor table for one media type.
+
+    A refresh only recomputes the rows of titles added or changed since the
+    table was built (and rows listing a changed title), and merges the
+    added and changed titles into the lists of the other rows that they are
+    closer to than their current k-th neighbor. A full
+    rebuild happens when there is no table, the catalog has doubled in
+    size since the table's normalization was computed, or full=True.
+    Returns the number of rows recomputed.
+    """
+    import numpy as np
+    init_engine()
+    feature_key = "movie_features" if media_type == "movie" else "tv_features"
+    with state_lock:
+        store = history_data[feature_key]
+        titles = list(store.titles)
+        raw = np.array(store.matrix())
+    k = min(k, len(titles) - 1)
+    if k < 1:
+        return 0
+
+    table = neighbor_tables[media_type]
+    table.load()
+    if (full or table.neighbors is None or table.neighbors.shape[1] != k
+            or titles[:len(table.titles)] != table.titles or len(titles) >= 2 * len(table.titles)):
+        with instrumentation.stage("neighbors.full"):
+            mean, std = raw.mean(axis=0), raw.std(axis=0) + 1e-10
+            features = _normalize_with(raw, mean, std)
+            rows = np.arange(len(titles))
+            table.neighbors, table.distances = _compute_neighbors(features, rows, k, workers)
+            table.titles, table.mean, table.std = titles, mean, std
+            table.features = raw
+            table.rows = {title: row for row, title in enumerate(titles)}
+            table.save()
+        return len(titles)
+
+    with instrumentation.stage("neighbors.refresh"):
+        old_n = len(table.titles)
+        dims = max(raw.shape[1], table.features.shape[1])
+        old_raw = np.zeros((old_n, dims))
+        old_raw[:, :table.features.shape[1]] = table.features
+        new_raw = np.zeros((len(titles), dims))
+        new_raw[:, :raw.shape[1]] = raw
+        changed = np.flatnonzero((old_raw != new_raw[:old_n]).any(axis=1))
+        added = np.arange(old_n, len(titles))
+        dirty = np.concatenate([changed, added]).astype(np.int64)
+        if not len(dirty):
+            return 0
+        features = _normalize_with(new_raw, table.mean, table.std)
+
+        neighbors = np.zeros((len(titles), k), dtype=np.int32)
+        distances = np.zeros((len(titles), k), dtype=np.float32)
+        neighbors[:old_n], distances[:old_n] = table.neighbors, table.distances
+        # Rows whose list contains a changed title must be recomputed too
+        stale = np.flatnonzero(np.isin(table.neighbors, changed).any(axis=1)) if len(changed) else []
+        recompute = np.union1d(dirty, stale).astype(np.int64)
+        neighbors[recompute], distances[recompute] = _compute_neighbors(features, recompute, k, workers)
+
+        # Merge the changed and added titles into every other row they now rank in
+        keep = np.setdiff1d(np.arange(old_n), recompute)
+        if len(keep):
+            dirty_features = features[dirty]
+            dirty_norms = (dirty_features ** 2).sum(axis=1)
+            chunk_size = max(1, 4 * 1024 * 1024 // (len(dirty) * (k + 1)))
+            for start in range(0, len(keep), chunk_size):
+                rows = keep[start:start + chunk_size]
+                squared = ((features[rows] ** 2).sum(axis=1)[:, None] + dirty_norms[None, :]
+                           - 2 * features[rows] @ dirty_features.T)
+                to_dirty = np.sqrt(np.maximum(squared, 0))
+                # A title already in a row's list is never merged in twice
+                listed = (neighbors[rows][:, :, None] == dirty[None, None, :]).any(axis=1)
+                to_dirty[listed] = np.inf
+                hit = (to_dirty < distances[rows, -1][:, None]).any(axis=1)
+                if not hit.any():
+                    continue
+                rows, to_dirty = rows[hit], to_dirty[hit]
+                merged_idx = np.hstack([neighbors[rows], np.broadcast_to(dirty, to_dirty.shape)])
+                merged_dist = np.hstack([distances[rows], to_dirty.astype(np.float32)])
+                order = np.argsort(merged_dist, axis=1, kind="stable")[:, :k]
+                neighbors[rows] = np.take_along_axis(merged_idx, order, axis=1)
+                distances[rows] = np.take_along_axis(merged_dist, order, axis=1)
+                recompute = np.union1d(recompute, rows)
+
+        table.titles, table.neighbors, table.distances = titles, neighbors, distances
+        table.features = new_raw
+        table.rows = {title: row for row, title in enumerate(titles)}
+        table.save()
+        return len(recompute)
+
 def get_knn_recommendations(title, media_type="movie", n_recommendations=5):
-    """Get recommendations using KNN algorithm"""
+    """Get recommendations using KNN algorithm.
+
+    Served from the precomputed neighbor table when it covers the title,
+    otherwise from the live KNN index.
+    """
     try:
         feature_key = "movie_features" if media_type == "movie" else "tv_features"
         if title not in history_data[feature_key]:
             return []
-            
-        knn_data = build_knn_model(media_type)
-        if not knn_data:
-            return []
-            
-        model, titles, features = knn_data
-        title_idx = titles.index(title)
-        
-        distances, indices = model.kneighbors([features[title_idx]])
+
+        n_neighbors = min(n_recommendations, KNN_NEIGHBORS - 1)
+        with instrumentation.stage("knn.table_lookup"):
+            neighbor_titles = neighbor_tables[media_type].lookup(title, n_neighbors)
+        if neighbor_titles is None:
+            knn_data = build_knn_model(media_type)
+            if not knn_data:
+                return []
+
+            index = knn_indexes[media_type]
+            with state_lock:
+                neighbors = index.neighbors(index.store.rows[title], n_neighbors)
+                neighbor_titles = [index.store.titles[idx] for idx in neighbors]
         recommendations = []
-        for idx in indices[0][1:n_recommendations+1]:  # Skip the first one (itself)
-            rec_title = titles[idx]
+        for rec_title in neighbor_titles:
             if media_type == "movie" and rec_title in history_data["movies"]:
                 recommendations.append(format_movie_data_from_storage(rec_title))
             elif media_type == "tv" and rec_title in history_data["tv_shows"]:
@@ -245,38 +2082,174 @@ def get_knn_recommendations(title, media_type="movie", n_recommendations=5):
         print(f"Error getting KNN recommendations: {str(e)}")
         return []
 
+ASSOCIATION_WINDOW = 3
+MAX_ASSOCIATION_RULES = 10
+RULE_METRICS = ["antecedent support", "consequent support", "support", "confidence", "lift", "leverage", "conviction"]
+
+def _rule_record(antecedent, consequent, count_a, count_c, count_ac, n_transactions):
+    """Build a rule dict with the same metrics mlxtend's association_rules reports"""
+    support_a = count_a / n_transactions
+    support_c = count_c / n_transactions
+    support = count_ac / n_transactions
+    confidence = support / support_a
+    return {
+        "antecedents": sorted(antecedent),
+        "consequents": sorted(consequent),
+        "antecedent support": support_a,
+        "consequent support": support_c,
+        "support": support,
+        "confidence": confidence,
+        "lift": confidence / support_c,
+        "leverage": support - support_a * support_c,
+        "conviction": (1 - support_c) / (1 - confidence) if confidence < 1 else float("inf")
+    }
+
+def _rule_sort_key(rule):
+    return (-rule["lift"], -rule["confidence"], -rule["support"], rule["antecedents"], rule["consequents"])
+
+class AssociationMiner:
+    """Incremental association-rule miner over sliding watch-history windows.
+
+    Every window of ASSOCIATION_WINDOW consecutive titles is one transaction.
+    Appending a title adds exactly one window, so only the counts of that
+    window's subsets change. Only itemsets that occur in some window are
+    stored (at most 2**ASSOCIATION_WINDOW - 1 per window), so memory grows
+    with the history, never with windows x distinct titles. Itemsets are
+    also bucketed by count, which lets rules() visit just the frequent ones
+    instead of rerunning Apriori.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.by_count = defaultdict(set)
+        self.n_transactions = 0
+        self.last_window = None
+
+    def reset(self):
+        self.counts.clear()
+        self.by_count.clear()
+        self.n_transactions = 0
+        self.last_window = None
+
+    def add_window(self, window):
+        """Count one transaction"""
+        items = sorted(set(window))
+        for mask in range(1, 1 << len(items)):
+            itemset = frozenset(item for bit, item in enumerate(items) if mask & (1 << bit))
+            count = self.counts.get(itemset, 0)
+            if count:
+                self.by_count[count].discard(itemset)
+                if not self.by_count[count]:
+                    del self.by_count[count]
+            self.counts[itemset] = count + 1
+            self.by_count[count + 1].add(itemset)
+        self.n_transactions += 1
+        self.last_window = tuple(window)
+
+    def sync(self, watch_history):
+        """Count the windows appended to watch_history since the last sync"""
+        n_windows = max(len(watch_history) - ASSOCIATION_WINDOW + 1, 0)
+        if self.n_transactions:
+            start = self.n_transactions - 1
+            if (n_windows < self.n_transactions or
+                    tuple(watch_history[start:start + ASSOCIATION_WINDOW]) != self.last_window):
+                # History was rewritten rather than appended to; recount from scratch
+                self.reset()
+        for i in range(self.n_transactions, n_windows):
+            self.add_window(watch_history[i:i + ASSOCIATION_WINDOW])
+
+    def frequent_itemsets(self, min_support=MIN_SUPPORT):
+        """Yield (itemset, count) for every itemset whose support reaches min_support"""
+        for count, itemsets in self.by_count.items():
+            if count / self.n_transactions >= min_support:
+                for itemset in itemsets:
+                    yield itemset, count
+
+    def rules(self, min_support=MIN_SUPPORT, min_confidence=MIN_CONFIDENCE):
+        """Return all rules meeting the thresholds, best lift first"""
+        if not self.n_transactions:
+            return []
+        rules = []
+        for itemset, count in self.frequent_itemsets(min_support):
+            if len(itemset) < 2:
+                continue
+            items = sorted(itemset)
+            for mask in range(1, (1 << len(items)) - 1):
+                antecedent = frozenset(item for bit, item in enumerate(items) if mask & (1 << bit))
+                consequent = itemset - antecedent
+                rule = _rule_record(antecedent, consequent, self.counts[antecedent],
+                                    self.counts[consequent], count, self.n_transactions)
+                if rule["confidence"] >= min_confidence:
+                    rules.append(rule)
+        rules.sort(key=_rule_sort_key)
+        return rules
+
+def mine_association_rules_apriori(watch_history, min_support=MIN_SUPPORT, min_confidence=MIN_CONFIDENCE):
+    """Reference implementation: full Apriori with mlxtend over all windows"""
+    transactions = [watch_history[i:i + ASSOCIATION_WINDOW]
+                    for i in range(len(watch_history) - ASSOCIATION_WINDOW + 1)]
+    if not transactions:
+        return []
+
+    import pandas as pd
+    from mlxtend.preprocessing import TransactionEncoder
+    from mlxtend.frequent_patterns import apriori, association_rules
+
+    # Convert to a sparse one-hot encoded format
+    te = TransactionEncoder()
+    te_ary = te.fit(transactions).transform(transactions, sparse=True)
+    df = pd.DataFrame.sparse.from_spmatrix(te_ary, columns=te.columns_)
+
+    frequent_itemsets = apriori(df, min_support=min_support, use_colnames=True)
+    if len(frequent_itemsets) == 0:
+        return []
+    rules = association_rules(frequent_itemsets, metric="confidence", min_threshold=min_confidence)
+    records = []
+    for rule in rules.to_dict("records"):
+        record = {metric: float(rule[metric]) for metric in RULE_METRICS}
+        record["antecedents"] = sorted(rule["antecedents"])
+        record["consequents"] = sorted(rule["consequents"])
+        records.append(record)
+    records.sort(key=_rule_sort_key)
+    return records
+
+def verify_association_rules(watch_history=None, rel_tol=1e-9, reference=mine_association_rules_apriori):
+    """Check the incremental miner's rules against a fresh full run (mlxtend Apriori by default)"""
+    watch_history = history_data["watch_history"] if watch_history is None else watch_history
+    miner = AssociationMiner()
+    miner.sync(watch_history)
+
+    def by_items(rules):
+        return {(frozenset(r["antecedents"]), frozenset(r["consequents"])): r for r in rules}
+
+    expected = by_items(reference(watch_history))
+    actual = by_items(miner.rules())
+    if expected.keys() != actual.keys():
+        return False
+    for key, rule in expected.items():
+        for metric in RULE_METRICS:
+            if not math.isclose(rule[metric], actual[key][metric], rel_tol=rel_tol, abs_tol=1e-12):
+                return False
+    return True
+
 def update_association_rules():
-    """Update association rules using Apriori algorithm"""
+    """Update association rules from the incremental miner"""
     try:
-        if len(history_data["watch_history"]) < 5:
-            return
-            
-        # Prepare transaction data (user's watching sessions)
-        transactions = []
-        watch_history = history_data["watch_history"]
-        
-        for i in range(len(watch_history) - 2):
-            transactions.append(watch_history[i:i+3])
-        
-        if len(transactions) < 3:
-            return
-            
-        # Convert to one-hot encoded format
-        te = TransactionEncoder()
-        te_ary = te.fit(transactions).transform(transactions)
-        df = pd.DataFrame(te_ary, columns=te.columns_)
-        
-        # Run Apriori algorithm
-        frequent_itemsets = apriori(df, min_support=MIN_SUPPORT, use_colnames=True)
-        if len(frequent_itemsets) == 0:
-            return
-            
-        rules = association_rules(frequent_itemsets, metric="confidence", min_threshold=MIN_CONFIDENCE)
-        if len(rules) == 0:
-            return
-            
-        # Store the most relevant rules
-        history_data["association_rules"] = rules.sort_values('lift', ascending=False).head(10).to_dict('records')
+        with state_lock:
+            profile = current_profile()
+            if len(profile.state["watch_history"]) < 5:
+                return
+
+            profile.miner.sync(profile.state["watch_history"])
+            if profile.miner.n_transactions < 3:
+                return
+
+            rules = profile.miner.rules()
+            if len(rules) == 0:
+                return
+                
+            # Store the most relevant rules
+            record_mutation("rules", rules=rules[:MAX_ASSOCIATION_RULES])
         save_data()
     except Exception as e:
         print(f"Error updating association rules: {str(e)}")
@@ -311,9 +2284,13 @@ def get_association_recommendations():
         return []
 
 def format_movie_data_from_storage(title):
-    """Format movie data from our storage"""
+    """Format movie data from our storage (a catalog title or a media table key)"""
+    stored = history_data["media_table"].get(title)
+    if stored is not None:
+        return dict(stored)
     movie = history_data["movies"].get(title, {})
     return {
+        "id": movie.get("id"),
         "title": movie.get("title", title),
         "year": movie.get("year", "N/A"),
         "rating": movie.get("rating", "N/A"),
@@ -323,9 +2300,13 @@ def format_movie_data_from_storage(title):
     }
 
 def format_tv_data_from_storage(title):
-    """Format TV show data from our storage"""
+    """Format TV show data from our storage (a catalog title or a media table key)"""
+    stored = history_data["media_table"].get(title)
+    if stored is not None:
+        return dict(stored)
     tv = history_data["tv_shows"].get(title, {})
     return {
+        "id": tv.get("id"),
         "title": tv.get("title", title),
         "year": tv.get("year", "N/A"),
         "rating": tv.get("rating", "N/A"),
@@ -338,6 +2319,7 @@ def format_tv_data_from_storage(title):
 def format_movie_data(movie):
     """Standardize movie data format"""
     return {
+        "id": movie.get("id"),
         "title": movie.get("title", "Unknown"),
         "year": movie.get("release_date", "")[:4] if movie.get("release_date") else "N/A",
         "rating": movie.get("vote_average", "N/A"),
@@ -349,6 +2331,7 @@ def format_movie_data(movie):
 def format_tv_data(tv):
     """Standardize TV show data format"""
     return {
+        "id": tv.get("id"),
         "title": tv.get("name", "Unknown"),
         "year": tv.get("first_air_date", "")[:4] if tv.get("first_air_date") else "N/A",
         "rating": tv.get("vote_average", "N/A"),
@@ -360,6 +2343,8 @@ def format_tv_data(tv):
 
 def get_fallback_media(media_type="movie"):
     """Return fallback media"""
+    instrumentation.count("fallback_media")
+    mark_degraded()
     if media_type == "movie":
         return {
             "title": "The Shawshank Redemption",
@@ -380,234 +2365,407 @@ def get_fallback_media(media_type="movie"):
             "type": "tv"
         }
 
+def build_movie_info(details, query, recommendations):
+    """Build the stored movie record from TMDb details"""
+    return {
+        "id": details.get("id"),
+        "title": details.get("title", query),
+        "year": details.get("release_date", "")[:4] if details.get("release_date") else "N/A",
+        "rating": details.get("vote_average", "N/A"),
+        "genres": [g["name"] for g in details.get("genres", [])],
+        "actors": [cast["name"] for cast in details.get("credits", {}).get("cast", [])][:5],
+        "director": next((crew["name"] for crew in details.get("credits", {}).get("crew", []) 
+                     if crew.get("job") == "Director"), "Unknown"),
+        "recommendations": recommendations,
+        "type": "movie"
+    }
+
+def build_tv_info(details, query, recommendations):
+    """Build the stored TV show record from TMDb details"""
+    return {
+        "id": details.get("id"),
+        "title": details.get("name", query),
+        "year": details.get("first_air_date", "")[:4] if details.get("first_air_date") else "N/A",
+        "rating": details.get("vote_average", "N/A"),
+        "genres": [g["name"] for g in details.get("genres", [])],
+        "actors": [cast["name"] for cast in details.get("credits", {}).get("cast", [])][:5],
+        "seasons": details.get("number_of_seasons", "N/A"),
+        "recommendations": recommendations,
+        "type": "tv"
+    }
+
+def materialize_media(record):
+    """Return a catalog record with its recommendation keys expanded to formatted dicts"""
+    recommendations = record.get("recommendations")
+    if not recommendations or not any(isinstance(rec, str) for rec in recommendations):
+        return record
+    expanded = []
+    for rec in recommendations:
+        if isinstance(rec, str):
+            is_tv = rec.startswith("tv:")
+            rec = format_tv_data_from_storage(rec) if is_tv else format_movie_data_from_storage(rec)
+        expanded.append(rec)
+    return dict(record, recommendations=expanded)
+
+def store_watched_media(media_info, details, media_type="movie"):
+    """Store a watched title with its features, record the watch and refresh the models"""
+    extract_features = extract_movie_features if media_type == "movie" else extract_tv_features
+    with state_lock:
+        with instrumentation.stage("store.mutations"):
+            record_mutation("media", media_type=media_type, title=media_info["title"], data=media_info)
+            features = extract_features(details)
+            if features:
+                store_media_features(media_info["title"], features, media_type)
+            
+            record_mutation("watch", title=media_info["title"])
+            update_preferences(media_info, media_type)
+        
+        # Update recommendation models
+        with instrumentation.stage("store.association_rules"):
+            update_association_rules()
+    save_data()
+    prefetch_recommendations(media_info.get("recommendations"))
+
+def serve_local_title(title, media_type="movie"):
+    """Return a catalog title found by a search, recording the watch if this user hasn't seen it.
+
+    Titles can reach the catalog without being watched (bulk ingest,
+    prefetch, another user's history), so a local hit counts as a watch
+    the first time, without any API calls.
+    """
+    catalog = history_data["movies"] if media_type == "movie" else history_data["tv_shows"]
+    media_info = materialize_media(catalog[title])
+    with state_lock:
+        if title not in history_data["watch_history"]:
+            record_mutation("watch", title=title)
+            update_preferences(media_info, media_type)
+            update_association_rules()
+            watched = True
+        else:
+            watched = False
+    if watched:
+        save_data()
+    prefetch_recommendations(media_info.get("recommendations"))
+    return media_info
+
+class Prefetcher:
+    """Fetches details of recommended titles in the background.
+
+    Each recommendation with a TMDb id that is not in the catalog yet is
+    fetched with the same request a search would make (so it is also left
+    in the response cache), then stored in the catalog and feature store.
+    Nothing is added to watch history or preferences. Work runs on a small
+    thread pool under its own token bucket, so prefetching never uses more
+    than its budget of the API rate.
+    """
+
+    def __init__(self, concurrency=PREFETCH_CONCURRENCY, rate=PREFETCH_RATE_PER_SECOND):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.limiter = RateLimiter(rate=rate, burst=concurrency)
+        self.in_flight = set()
+        self.stats = {"submitted": 0, "stored": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def submit(self, recommendations):
+        for rec in recommendations or ():
+            if not isinstance(rec, dict) or not rec.get("id") or rec.get("type") not in ("movie", "tv"):
+                continue
+            catalog = history_data["movies"] if rec["type"] == "movie" else history_data["tv_shows"]
+            key = media_key(rec)
+            with self.lock:
+                if rec.get("title") in catalog or key in self.in_flight:
+                    continue
+                self.in_flight.add(key)
+                self.stats["submitted"] += 1
+            self.executor.submit(self._fetch, rec["id"], rec["type"], key)
+
+    def _fetch(self, media_id, media_type, key):
+        try:
+            self.limiter.acquire()
+            details = get_tmdb_data(f"/{media_type}/{media_id}", {"append_to_response": "credits,recommendations"})
+            if not details:
+                with self.lock:
+                    self.stats["failed"] += 1
+                return
+            build_info = build_movie_info if media_type == "movie" else build_tv_info
+            format_func = format_movie_data if media_type == "movie" else format_tv_data
+            extract_features = extract_movie_features if media_type == "movie" else extract_tv_features
+            recommendations = [format_func(rec) for rec in details.get("recommendations", {}).get("results", [])[:5]]
+            media_info = build_info(details, str(media_id), recommendations)
+            catalog = history_data["movies"] if media_type == "movie" else history_data["tv_shows"]
+            with state_lock:
+                if media_info["title"] in catalog:
+                    return
+                record_mutation("media", media_type=media_type, title=media_info["title"], data=media_info)
+                features = extract_features(details)
+                if features:
+                    store_media_features(media_info["title"], features, media_type)
+            save_data()
+            instrumentation.count("prefetch.stored")
+            with self.lock:
+                self.stats["stored"] += 1
+        except Exception as e:
+            print(f"Error prefetching {key}: {str(e)}", file=sys.stderr)
+            with self.lock:
+                self.stats["failed"] += 1
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
+
+    def close(self, wait=True):
+        """Drop queued work and wait for requests already running"""
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+prefetcher = None
+
+def enable_prefetch(concurrency=PREFETCH_CONCURRENCY, rate=PREFETCH_RATE_PER_SECOND):
+    """Start prefetching the details of recommended titles after each lookup"""
+    global prefetcher
+    if prefetcher is None:
+        prefetcher = Prefetcher(concurrency, rate)
+    return prefetcher
+
+def disable_prefetch():
+    global prefetcher
+    if prefetcher is not None:
+        prefetcher.close()
+        prefetcher = None
+
+def prefetch_recommendations(recommendations):
+    """Queue recommendations for background prefetch, if the prefetcher is enabled"""
+    if prefetcher is not None and recommendations:
+        prefetcher.submit(recommendations)
+
+@instrumentation.traced("search_movie")
 def search_movie(query):
     """Search for a movie and return its details"""
+    init_engine()
     try:
         normalized_query = query.lower().strip()
-        for title, data in history_data["movies"].items():
-            if title.lower().strip() == normalized_query:
-                return data
+        with instrumentation.stage("search_movie.local_lookup"):
+            local_title = title_indexes["movie"].lookup(query)
+        if local_title is not None:
+            return serve_local_title(local_title, "movie")
         
-        search_data = get_tmdb_data("/search/movie", {"query": query})
-        if not search_data or not search_data.get("results"):
+        with instrumentation.stage("search_movie.tmdb_search"):
+            results = search_tmdb("/search/movie", query, "movie")
+        if results is None:
+            print(f"Could not search for movie: {query}")
+            return get_fallback_media("movie")
+        if not results:
             print(f"No results found for movie: {query}")
             return get_fallback_media("movie")
         
-        movie = search_data["results"][0]
+        movie = results[0]
         movie_id = movie["id"]
         
-        details = get_tmdb_data(f"/movie/{movie_id}", {"append_to_response": "credits,recommendations"})
+        with instrumentation.stage("search_movie.tmdb_details"):
+            details = get_tmdb_data(f"/movie/{movie_id}", {"append_to_response": "credits,recommendations"})
         if not details:
             print(f"Could not get details for movie ID: {movie_id}")
             return get_fallback_media("movie")
         
-        movie_info = {
-            "title": details.get("title", query),
-            "year": details.get("release_date", "")[:4] if details.get("release_date") else "N/A",
-            "rating": details.get("vote_average", "N/A"),
-            "genres": [g["name"] for g in details.get("genres", [])],
-            "actors": [cast["name"] for cast in details.get("credits", {}).get("cast", [])][:5],
-            "director": next((crew["name"] for crew in details.get("credits", {}).get("crew", []) 
-                         if crew.get("job") == "Director"), "Unknown"),
-            "recommendations": get_recommendations(details, normalized_query, "movie"),
-            "type": "movie"
-        }
-        
-        # Store movie data and features
-        history_data["movies"][movie_info["title"]] = movie_info
-        features = extract_movie_features(details)
-        if features:
-            history_data["movie_features"][movie_info["title"]] = features
-        
-        history_data["watch_history"].append(movie_info["title"])
-        update_preferences(movie_info, "movie")
-        
-        # Update recommendation models
-        update_association_rules()
-        save_data()
-        
+        with instrumentation.stage("search_movie.recommendations"):
+            recommendations = get_recommendations(details, normalized_query, "movie")
+        movie_info = build_movie_info(details, query, recommendations)
+        store_watched_media(movie_info, details, "movie")
         return movie_info
     except Exception as e:
         print(f"Error in movie search: {str(e)}")
         return get_fallback_media("movie")
 
+@instrumentation.traced("search_tv_show")
 def search_tv_show(query):
     """Search for a TV show and return its details"""
+    init_engine()
     try:
         normalized_query = query.lower().strip()
-        for title, data in history_data["tv_shows"].items():
-            if title.lower().strip() == normalized_query:
-                return data
+        with instrumentation.stage("search_tv_show.local_lookup"):
+            local_title = title_indexes["tv"].lookup(query)
+        if local_title is not None:
+            return serve_local_title(local_title, "tv")
         
-        search_data = get_tmdb_data("/search/tv", {"query": query})
-        if not search_data or not search_data.get("results"):
+        with instrumentation.stage("search_tv_show.tmdb_search"):
+            results = search_tmdb("/search/tv", query, "tv")
+        if results is None:
+            print(f"Could not search for TV show: {query}")
+            return get_fallback_media("tv")
+        if not results:
             print(f"No results found for TV show: {query}")
             return get_fallback_media("tv")
         
-        tv = search_data["results"][0]
+        tv = results[0]
         tv_id = tv["id"]
         
-        details = get_tmdb_data(f"/tv/{tv_id}", {"append_to_response": "credits,recommendations"})
+        with instrumentation.stage("search_tv_show.tmdb_details"):
+            details = get_tmdb_data(f"/tv/{tv_id}", {"append_to_response": "credits,recommendations"})
         if not details:
             print(f"Could not get details for TV ID: {tv_id}")
             return get_fallback_media("tv")
         
-        tv_info = {
-            "title": details.get("name", query),
-            "year": details.get("first_air_date", "")[:4] if details.get("first_air_date") else "N/A",
-            "rating": details.get("vote_average", "N/A"),
-            "genres": [g["name"] for g in details.get("genres", [])],
-            "actors": [cast["name"] for cast in details.get("credits", {}).get("cast", [])][:5],
-            "seasons": details.get("number_of_seasons", "N/A"),
-            "recommendations": get_recommendations(details, normalized_query, "tv"),
-            "type": "tv"
-        }
-        
-        # Store TV data and features
-        history_data["tv_shows"][tv_info["title"]] = tv_info
-        features = extract_tv_features(details)
-        if features:
-            history_data["tv_features"][tv_info["title"]] = features
-        
-        history_data["watch_history"].append(tv_info["title"])
-        update_preferences(tv_info, "tv")
-        
-        # Update recommendation models
-        update_association_rules()
-        save_data()
-        
+        with instrumentation.stage("search_tv_show.recommendations"):
+            recommendations = get_recommendations(details, normalized_query, "tv")
+        tv_info = build_tv_info(details, query, recommendations)
+        store_watched_media(tv_info, details, "tv")
         return tv_info
     except Exception as e:
         print(f"Error in TV show search: {str(e)}")
         return get_fallback_media("tv")
 
+def recommendation_seen_titles(details, original_title):
+    """Lowercased titles a recommendation list for details must not contain"""
+    return {original_title, details.get("title", "").lower(), details.get("name", "").lower()}
+
+def official_recommendations(details, media_type="movie"):
+    """Yield TMDb's own recommendations from a details payload, formatted"""
+    format_func = format_movie_data if media_type == "movie" else format_tv_data
+    for rec in details.get("recommendations", {}).get("results") or []:
+        if rec.get("title", rec.get("name", "")).strip():
+            yield format_func(rec)
+
+def merge_recommendations(recommendations, seen_titles, recs, limit=5):
+    """Append recs whose titles are not in seen_titles, in order, until there are limit of them"""
+    for rec in recs:
+        if len(recommendations) >= limit:
+            break
+        key = rec["title"].lower()
+        if key not in seen_titles:
+            recommendations.append(rec)
+            seen_titles.add(key)
+    return recommendations
+
+@memoized_on_state(_recommendations_key)
 def get_recommendations(details, original_title, media_type="movie"):
     """Get recommendations from multiple sources"""
     try:
         recommendations = []
-        seen_titles = {original_title, details.get("title", "").lower(), details.get("name", "").lower()}
+        seen_titles = recommendation_seen_titles(details, original_title)
         
         # 1. Get KNN recommendations first
-        title = details.get("title") if media_type == "movie" else details.get("name")
-        knn_recs = get_knn_recommendations(title, media_type, 3)
-        for rec in knn_recs:
-            if rec["title"].lower() not in seen_titles:
-                recommendations.append(rec)
-                seen_titles.add(rec["title"].lower())
+        with instrumentation.stage("recommendations.knn"):
+            title = details.get("title") if media_type == "movie" else details.get("name")
+            merge_recommendations(recommendations, seen_titles, get_knn_recommendations(title, media_type, 3))
         
         # 2. Official recommendations
-        if details.get("recommendations", {}).get("results"):
-            for rec in details["recommendations"]["results"]:
-                title = rec.get("title", rec.get("name", "")).strip()
-                if title and title.lower() not in seen_titles:
-                    if media_type == "movie":
-                        recommendations.append(format_movie_data(rec))
-                    else:
-                        recommendations.append(format_tv_data(rec))
-                    seen_titles.add(title.lower())
-                    if len(recommendations) >= 5:
-                        break
-        
-        # 3. Similar by genre if needed
-        if len(recommendations) < 5 and details.get("genres"):
-            genre_recs = get_media_by_genres(
-                [g["name"] for g in details.get("genres", [])], 
-                media_type,
-                5 - len(recommendations), 
-                exclude_titles=seen_titles
-            )
-            recommendations.extend(genre_recs)
-            seen_titles.update([r["title"].lower() for r in genre_recs])
+        with instrumentation.stage("recommendations.official"):
+            merge_recommendations(recommendations, seen_titles, official_recommendations(details, media_type))
+        
+        # 3. Similar by genre if needed, with the popular fallback fetched alongside
+        with instrumentation.stage("recommendations.genre_discover"):
+            popular_recs = None
+            if len(recommendations) < 5 and details.get("genres"):
+                excluded = set(seen_titles)
+                genre_recs, popular_recs = fan_out(
+                    lambda: get_media_by_genres(
+                        [g["name"] for g in details.get("genres", [])], 
+                        media_type,
+                        5 - len(recommendations), 
+                        exclude_titles=excluded
+                    ),
+                    lambda: get_popular_media(media_type, 5, exclude_titles=excluded)
+                )
+                merge_recommendations(recommendations, seen_titles, genre_recs)
         
         # 4. Association rule recommendations
-        if len(recommendations) < 5:
-            assoc_recs = get_association_recommendations()
-            for rec in assoc_recs:
-                if rec["title"].lower() not in seen_titles:
-                    recommendations.append(rec)
-                    seen_titles.add(rec["title"].lower())
-                    if len(recommendations) >= 5:
-                        break
+        with instrumentation.stage("recommendations.association"):
+            if len(recommendations) < 5:
+                merge_recommendations(recommendations, seen_titles, get_association_recommendations())
         
         # 5. Popular media as final fallback
         if len(recommendations) < 5:
-            popular_recs = get_popular_media(media_type, 5 - len(recommendations), exclude_titles=seen_titles)
-            recommendations.extend(popular_recs)
+            instrumentation.count("recommendations.popular_fallback")
+            with instrumentation.stage("recommendations.popular"):
+                if popular_recs is None:
+                    popular_recs = get_popular_media(media_type, 5 - len(recommendations), exclude_titles=seen_titles)
+                merge_recommendations(recommendations, seen_titles, popular_recs)
         
-        return recommendations[:5]
+        return recommendations
     except Exception as e:
         print(f"Error generating recommendations: {str(e)}")
+        mark_degraded()
         return get_popular_media(media_type, 5)
 
+def iter_tmdb_media(endpoint, params=None, media_type="movie", count=5, exclude_titles=None,
+                    max_pages=MAX_RESULT_PAGES):
+    """Stream formatted items from a paginated TMDb listing.
+
+    Titles in exclude_titles (lowercased) and titles already yielded are
+    skipped as pages arrive, and the generator stops once count items have
+    been yielded. The next page is fetched in the background while the
+    current one is consumed, but only when the current page cannot fill
+    count by itself, so no page is requested that won't be used.
+    """
+    params = dict(params or {})
+    format_func = format_movie_data if media_type == "movie" else format_tv_data
+    seen = set(exclude_titles or ())
+    yielded = 0
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def fetch(page):
+        # Page 1 keeps the unpaginated params so it shares cache entries with older callers
+        page_params = dict(params, page=page) if page > 1 else params
+        return executor.submit(contextvars.copy_context().run, get_tmdb_data, endpoint, page_params)
+
+    try:
+        page, future = 1, fetch(1)
+        while future is not None:
+            data = future.result()
+            if not data or not data.get("results"):
+                return
+            items = []
+            for item in data["results"]:
+                title = item.get("title", item.get("name", "")).strip()
+                if title and title.lower() not in seen:
+                    seen.add(title.lower())
+                    items.append(item)
+            last_page = min(data.get("total_pages") or 1, max_pages)
+            future = fetch(page + 1) if page < last_page and yielded + len(items) < count else None
+            page += 1
+            for item in items:
+                yield format_func(item)
+                yielded += 1
+                if yielded >= count:
+                    return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def get_media_by_genres(genres, media_type="movie", count=5, exclude_titles=None):
     """Get media matching specific genres"""
     if not genres:
         return []
     
-    exclude_titles = exclude_titles or set()
-    genre_ids = []
-    
     # Find genre IDs for the specified media type
-    prefix = "movie_" if media_type == "movie" else "tv_"
-    for gid, name in history_data["genre_cache"].items():
-        if gid.startswith(prefix) and name in genres:
-            genre_ids.append(gid.replace(prefix, ""))
-    
+    genre_ids = genre_registry.ids_for(genres, media_type)
     if not genre_ids:
         return []
     
     endpoint = "/discover/movie" if media_type == "movie" else "/discover/tv"
-    discover_data = get_tmdb_data(endpoint, {
-        "with_genres": ",".join(genre_ids),
+    params = {
+        "with_genres": ",".join(str(gid) for gid in sorted(set(genre_ids))),
         "sort_by": "popularity.desc"
-    })
-    
-    if not discover_data or not discover_data.get("results"):
-        return []
-    
-    recommendations = []
-    for item in discover_data["results"]:
-        title = item.get("title", item.get("name", "")).strip()
-        if title and title.lower() not in exclude_titles:
-            if media_type == "movie":
-                recommendations.append(format_movie_data(item))
-            else:
-                recommendations.append(format_tv_data(item))
-            if len(recommendations) >= count:
-                break
-    
-    return recommendations
+    }
+    return list(iter_tmdb_media(endpoint, params, media_type, count, exclude_titles))
 
 def get_popular_media(media_type="movie", count=5, exclude_titles=None):
     """Get currently popular media"""
-    exclude_titles = exclude_titles or set()
     endpoint = "/movie/popular" if media_type == "movie" else "/tv/popular"
-    popular_data = get_tmdb_data(endpoint)
-    
-    if not popular_data or not popular_data.get("results"):
-        return [get_fallback_media(media_type) for _ in range(count)]
-    
-    recommendations = []
-    for item in popular_data["results"]:
-        title = item.get("title", item.get("name", "")).strip()
-        if title and title.lower() not in exclude_titles:
-            if media_type == "movie":
-                recommendations.append(format_movie_data(item))
-            else:
-                recommendations.append(format_tv_data(item))
-            if len(recommendations) >= count:
-                break
-    
+    recommendations = list(iter_tmdb_media(endpoint, None, media_type, count, exclude_titles))
+    if not recommendations:
+        return [get_fallback_media(media_type)]
     return recommendations
 
 def search_people(query, role):
     """Search for actors or directors"""
-    search_data = get_tmdb_data("/search/person", {"query": query})
-    if not search_data or not search_data.get("results"):
+    init_engine()
+    results = search_tmdb("/search/person", query, f"person:{role}")
+    if results is None:
+        print(f"Could not search for {role}: {query}")
+        return None
+    if not results:
         print(f"No results found for {role}: {query}")
         return None
     
-    person = search_data["results"][0]
+    person = results[0]
     person_id = person["id"]
     
     credits_data = get_tmdb_data(f"/person/{person_id}/movie_credits")
@@ -628,28 +2786,22 @@ def search_people(query, role):
 
 def search_genre(query, media_type="movie"):
     """Search for media by genre"""
-    prefix = "movie_" if media_type == "movie" else "tv_"
-    genre_id = next((gid.replace(prefix, "") for gid, name in history_data["genre_cache"].items() 
-                    if gid.startswith(prefix) and name.lower() == query.lower()), None)
-    if not genre_id:
+    init_engine()
+    genre_id = genre_registry.id_for(query, media_type)
+    if genre_id is None:
         print(f"Genre not found: {query}")
         return None
     
     endpoint = "/discover/movie" if media_type == "movie" else "/discover/tv"
-    discover_data = get_tmdb_data(endpoint, {
-        "with_genres": genre_id,
-        "sort_by": "popularity.desc"
-    })
-    
-    if not discover_data or not discover_data.get("results"):
+    items = list(iter_tmdb_media(endpoint, {"with_genres": genre_id, "sort_by": "popularity.desc"}, media_type, 5))
+    if not items:
         print(f"No {media_type} found for genre: {query}")
         return None
     
-    format_func = format_movie_data if media_type == "movie" else format_tv_data
     return {
         "genre": query,
         "type": media_type,
-        "items": [format_func(item) for item in discover_data["results"][:5]]
+        "items": items
     }
 
 def update_preferences(media_data, media_type="movie"):
@@ -658,25 +2810,32 @@ def update_preferences(media_data, media_type="movie"):
         return
     
     genre_key = "movie_genres" if media_type == "movie" else "tv_genres"
+    deltas = {genre_key: defaultdict(int), "actors": defaultdict(int), "directors": defaultdict(int)}
     for genre in media_data.get("genres", []):
-        history_data["preferences"][genre_key][genre] += 1
+        deltas[genre_key][genre] += 1
     
     for actor in media_data.get("actors", []):
-        history_data["preferences"]["actors"][actor] += 1
+        deltas["actors"][actor] += 1
     
     if media_type == "movie":
         director = media_data.get("director", "")
         if director and director != "Unknown":
-            history_data["preferences"]["directors"][director] += 1
+            deltas["directors"][director] += 1
 
+    record_mutation("preferences", deltas={key: dict(value) for key, value in deltas.items() if value})
+
+@instrumentation.traced("get_personalized_recommendations")
+@memoized_on_state(lambda: ())
 def get_personalized_recommendations():
     """Get recommendations based on user preferences"""
+    init_engine()
     try:
         if not history_data["watch_history"]:
             return []
         
         # Try association rules first
-        assoc_recs = get_association_recommendations()
+        with instrumentation.stage("personalized.association"):
+            assoc_recs = get_association_recommendations()
         if assoc_recs:
             return assoc_recs[:5]
         
@@ -684,10 +2843,11 @@ def get_personalized_recommendations():
         last_watched = history_data["watch_history"][-1]
         knn_recs = []
         
-        if last_watched in history_data["movies"]:
-            knn_recs = get_knn_recommendations(last_watched, "movie", 3)
-        elif last_watched in history_data["tv_shows"]:
-            knn_recs = get_knn_recommendations(last_watched, "tv", 3)
+        with instrumentation.stage("personalized.knn"):
+            if last_watched in history_data["movies"]:
+                knn_recs = get_knn_recommendations(last_watched, "movie", 3)
+            elif last_watched in history_data["tv_shows"]:
+                knn_recs = get_knn_recommendations(last_watched, "tv", 3)
         
         if knn_recs:
             return knn_recs[:5]
@@ -695,23 +2855,26 @@ def get_personalized_recommendations():
         # Fall back to genre-based if needed
         recommendations = []
         
-        # Check movie preferences
+        # Check movie and TV preferences
         top_movie_genres = sorted(history_data["preferences"]["movie_genres"].items(), 
                                key=lambda x: x[1], reverse=True)[:3]
         preferred_movie_genres = [g[0] for g in top_movie_genres if g[1] > 0]
-        
-        if preferred_movie_genres:
-            movie_recs = get_media_by_genres(preferred_movie_genres, "movie", 3)
-            recommendations.extend(movie_recs)
-        
-        # Check TV preferences
         top_tv_genres = sorted(history_data["preferences"]["tv_genres"].items(), 
                              key=lambda x: x[1], reverse=True)[:3]
         preferred_tv_genres = [g[0] for g in top_tv_genres if g[1] > 0]
         
-        if preferred_tv_genres and len(recommendations) < 5:
-            tv_recs = get_media_by_genres(preferred_tv_genres, "tv", 5 - len(recommendations))
-            recommendations.extend(tv_recs)
+        # The genre and popular lookups are independent, so fetch them together
+        with instrumentation.stage("personalized.genre_and_popular"):
+            movie_recs, tv_recs, popular_movies, popular_tv = fan_out(
+                lambda: get_media_by_genres(preferred_movie_genres, "movie", 3),
+                lambda: get_media_by_genres(preferred_tv_genres, "tv", 5),
+                lambda: get_popular_media("movie", 3),
+                lambda: get_popular_media("tv", 5)
+            )
+        recommendations.extend(movie_recs)
+        
+        if len(recommendations) < 5:
+            recommendations.extend(tv_recs[:5 - len(recommendations)])
         
         # Fallback to popular if needed
         if len(recommendations) < 5:
@@ -719,14 +2882,126 @@ def get_personalized_recommendations():
             movie_count = min(remaining, 3)
             tv_count = remaining - movie_count
             
-            recommendations.extend(get_popular_media("movie", movie_count))
+            recommendations.extend(popular_movies[:movie_count])
             if tv_count > 0:
-                recommendations.extend(get_popular_media("tv", tv_count))
+                recommendations.extend(popular_tv[:tv_count])
         
         return recommendations[:5]
     except Exception as e:
         print(f"Error getting personalized recommendations: {str(e)}")
-        return get_popular_media("movie", 3) + get_popular_media("tv", 2)
+        mark_degraded()
+        popular_movies, popular_tv = fan_out(
+            lambda: get_popular_media("movie", 3),
+            lambda: get_popular_media("tv", 2)
+        )
+        return popular_movies + popular_tv
+
+# Async engine: same behaviour as the functions above, with network stages overlapped
+
+async def get_tmdb_data_async(endpoint, params=None):
+    """Async get_tmdb_data; the pooled blocking call runs on a worker thread"""
+    return await asyncio.to_thread(get_tmdb_data, endpoint, params)
+
+async def get_recommendations_async(details, original_title, media_type="movie"):
+    """Async get_recommendations.
+
+    Unless TMDb's own recommendations already hold five unseen titles, the
+    genre discover and popular stages start immediately, alongside KNN,
+    instead of waiting for the stages before them. Results are merged with
+    the same merge_recommendations routine and priority order.
+    """
+    memo_key = recommendation_memo.key("get_recommendations", *_recommendations_key(details, original_title, media_type))
+    cached = recommendation_memo.get(memo_key)
+    if cached is not None:
+        instrumentation.count("memo.hits get_recommendations")
+        return cached
+
+    with tracking_fallbacks() as flags:
+        recommendations = []
+        seen_titles = recommendation_seen_titles(details, original_title)
+        title = details.get("title") if media_type == "movie" else details.get("name")
+        genres = [g["name"] for g in details.get("genres", [])]
+        official = list(official_recommendations(details, media_type))
+        # KNN can only add titles, so the later stages are needed only if the official list can't fill five
+        may_need_more = len({rec["title"].lower() for rec in official} - seen_titles) < 5
+        excluded = set(seen_titles)
+
+        knn_task = asyncio.create_task(asyncio.to_thread(get_knn_recommendations, title, media_type, 3))
+        genre_task = popular_task = None
+        if may_need_more and genres:
+            genre_task = asyncio.create_task(asyncio.to_thread(get_media_by_genres, genres, media_type, 5, excluded))
+        if may_need_more:
+            popular_task = asyncio.create_task(asyncio.to_thread(get_popular_media, media_type, 5, excluded))
+        pending = [task for task in (knn_task, genre_task, popular_task) if task is not None]
+
+        try:
+            # 1. KNN recommendations first, then 2. official recommendations
+            merge_recommendations(recommendations, seen_titles, await knn_task)
+            merge_recommendations(recommendations, seen_titles, official)
+
+            # 3. Similar by genre
+            if len(recommendations) < 5 and genre_task is not None:
+                merge_recommendations(recommendations, seen_titles, await genre_task)
+
+            # 4. Association rule recommendations
+            if len(recommendations) < 5:
+                merge_recommendations(recommendations, seen_titles, get_association_recommendations())
+
+            # 5. Popular media as final fallback
+            if len(recommendations) < 5 and popular_task is not None:
+                merge_recommendations(recommendations, seen_titles, await popular_task)
+
+            if not flags["degraded"]:
+                recommendation_memo.put(memo_key, recommendations)
+            return recommendations
+        except Exception as e:
+            print(f"Error generating recommendations: {str(e)}")
+            mark_degraded()
+            return await asyncio.to_thread(get_popular_media, media_type, 5)
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+
+async def _search_media_async(query, media_type):
+    init_engine()
+    label = "movie" if media_type == "movie" else "TV show"
+    try:
+        normalized_query = query.lower().strip()
+        local_title = title_indexes[media_type].lookup(query)
+        if local_title is not None:
+            return await asyncio.to_thread(serve_local_title, local_title, media_type)
+
+        results = await asyncio.to_thread(search_tmdb, f"/search/{media_type}", query, media_type)
+        if results is None:
+            print(f"Could not search for {label}: {query}")
+            return get_fallback_media(media_type)
+        if not results:
+            print(f"No results found for {label}: {query}")
+            return get_fallback_media(media_type)
+
+        media_id = results[0]["id"]
+        details = await get_tmdb_data_async(f"/{media_type}/{media_id}", {"append_to_response": "credits,recommendations"})
+        if not details:
+            print(f"Could not get details for {label} ID: {media_id}")
+            return get_fallback_media(media_type)
+
+        recommendations = await get_recommendations_async(details, normalized_query, media_type)
+        build_info = build_movie_info if media_type == "movie" else build_tv_info
+        media_info = build_info(details, query, recommendations)
+        await asyncio.to_thread(store_watched_media, media_info, details, media_type)
+        return media_info
+    except Exception as e:
+        print(f"Error in {label} search: {str(e)}")
+        return get_fallback_media(media_type)
+
+async def search_movie_async(query):
+    """Async search_movie"""
+    return await _search_media_async(query, "movie")
+
+async def search_tv_show_async(query):
+    """Async search_tv_show"""
+    return await _search_media_async(query, "tv")
 
 def display_recommendations(recommendations, title="Recommended Media"):
     """Display recommendations in a nice format"""
@@ -773,7 +3048,7 @@ def display_media_results(media_data, query, media_type="movie"):
         
         if media_data.get("recommendations"):
             rec_title = f"Similar {media_type_str}s" if media_type == "movie" else "Similar TV Shows"
-            display_recommendations(media_data["recommendations"], rec_title)
+            display_recommendations(materialize_media(media_data)["recommendations"], rec_title)
         else:
             print(f"\nNo similar {media_type_str}s found. Here are some popular recommendations:")
             display_recommendations(get_popular_media(media_type, 5))
@@ -798,7 +3073,11 @@ def display_genre_results(data, query):
         display_recommendations(data["items"])
     else:
         print("\nGenre not found or no media available. Here are some popular recommendations:")
-        display_recommendations(get_popular_media("movie", 3) + get_popular_media("tv", 2))
+        popular_movies, popular_tv = fan_out(
+            lambda: get_popular_media("movie", 3),
+            lambda: get_popular_media("tv", 2)
+        )
+        display_recommendations(popular_movies + popular_tv)
 
 def main():
     """Main program loop"""
@@ -806,7 +3085,8 @@ def main():
         print("🎥 Media Recommendation Engine (Movies & TV Shows)")
         print("Type 'exit' at any time to return to the menu\n")
         
-        # Initialize genre cache
+        # Load history, then initialize genre cache
+        init_engine()
         cache_genres()
         
         while True:
@@ -815,7 +3095,7 @@ def main():
             
             if choice == '6' or choice.lower() == 'exit':
                 print("\nThanks for using the Media Recommendation Engine!")
-                save_data()
+                compact_data()
                 break
             
             if choice == '1':
@@ -874,8 +3154,403 @@ def main():
     except Exception as e:
         print(f"An unexpected error occurred: {str(e)}")
 
+BATCH_LOOKUPS = {
+    "movie": lambda query, media_type: search_movie(query),
+    "tv": lambda query, media_type: search_tv_show(query),
+    "actor": lambda query, media_type: search_people(query, "actor"),
+    "director": lambda query, media_type: search_people(query, "director"),
+    "genre": lambda query, media_type: search_genre(query, media_type),
+}
+
+def parse_batch_line(line):
+    """Parse one batch query line.
+
+    Accepts JSON objects such as {"type": "genre", "query": "Drama",
+    "media_type": "tv"} or plain "type: query" lines. Returns
+    (type, query, media_type) or None for blank and comment lines.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        entry = json.loads(line)
+        kind, query = entry["type"], entry["query"]
+        media_type = entry.get("media_type", "movie")
+    else:
+        kind, _, query = line.partition(":")
+        media_type = "movie"
+        if "/" in kind:
+            kind, media_type = kind.split("/", 1)
+    kind, query = kind.strip().lower(), query.strip()
+    media_type = "tv" if media_type.strip().lower() in ("tv", "t") else "movie"
+    if kind not in BATCH_LOOKUPS or not query:
+        raise ValueError(f"Invalid batch query: {line}")
+    return kind, query, media_type
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+def run_batch(lines, output, concurrency=BATCH_CONCURRENCY):
+    """Run many lookups and write one JSON line per query to output.
+
+    Identical lookups (same type, normalized query and media type) run once
+    and share their result. Unique lookups run on a bounded thread pool,
+    history is saved once at the end, and throughput plus latency
+    percentiles are returned.
+    """
+    init_engine()
+    cache_genres()
+    queries = []
+    for line_no, line in enumerate(lines, 1):
+        try:
+            parsed = parse_batch_line(line)
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            print(f"Skipping line {line_no}: {str(e)}", file=sys.stderr)
+            continue
+        if parsed:
+            queries.append(parsed)
+
+    groups = OrderedDict()
+    for kind, query, media_type in queries:
+        key = (kind, normalize_title(query), media_type if kind == "genre" else None)
+        groups.setdefault(key, (kind, query, media_type))
+
+    latencies = {}
+
+    def run_lookup(key):
+        kind, query, media_type = groups[key]
+        start = time.perf_counter()
+        try:
+            result = BATCH_LOOKUPS[kind](query, media_type)
+        except Exception as e:
+            print(f"Error in batch lookup {kind}: {query}: {str(e)}", file=sys.stderr)
+            result = None
+        latencies[key] = time.perf_counter() - start
+        return result
+
+    start = time.perf_counter()
+    with redirect_stdout(sys.stderr), deferred_saves():
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            futures = {key: executor.submit(contextvars.copy_context().run, run_lookup, key) for key in groups}
+            results = {key: future.result() for key, future in futures.items()}
+    elapsed = time.perf_counter() - start
+
+    for kind, query, media_type in queries:
+        key = (kind, normalize_title(query), media_type if kind == "genre" else None)
+        record = {"type": kind, "query": query, "result": results[key]}
+        if kind == "genre":
+            record["media_type"] = media_type
+        output.write(json.dumps(record) + "\n")
+    output.flush()
+
+    timings = sorted(latencies.values())
+    return {
+        "queries": len(queries),
+        "unique_lookups": len(groups),
+        "seconds": elapsed,
+        "queries_per_second": len(queries) / elapsed if elapsed else 0.0,
+        "latency_p50_ms": _percentile(timings, 50) * 1000,
+        "latency_p90_ms": _percentile(timings, 90) * 1000,
+        "latency_p99_ms": _percentile(timings, 99) * 1000,
+        "latency_max_ms": (timings[-1] if timings else 0.0) * 1000,
+    }
+
+def _ingest_chunk(lines, media_type):
+    """Parse a chunk of TMDb detail records into (title, catalog record, features) tuples.
+
+    Runs in a worker process, so it only uses pure helpers. Returns the
+    parsed entries and the number of lines that could not be used.
+    """
+    build_info = build_movie_info if media_type == "movie" else build_tv_info
+    extract_features = extract_movie_features if media_type == "movie" else extract_tv_features
+    entries = []
+    errors = 0
+    for line in lines:
+        try:
+            details = json.loads(line)
+            title = (details.get("title") if media_type == "movie" else details.get("name")) or ""
+            if not title.strip():
+                raise ValueError("record has no title")
+            entries.append((title, build_info(details, title, []), extract_features(details)))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            errors += 1
+    return entries, errors
+
+def _read_chunks(lines, chunk_size):
+    chunk = []
+    for line in lines:
+        if line.strip():
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def ingest_catalog(lines, media_type="movie", workers=None, chunk_size=INGEST_CHUNK_SIZE):
+    """Bulk-load TMDb detail records (one JSON object per line) into the catalog.
+
+    Lines are read lazily and parsed in chunks on a process pool, with at
+    most two chunks per worker in flight, so memory for parsing stays flat
+    however large the input is. Titles already in the catalog are kept as
+    they are. New ones go straight into the catalog and feature store
+    without being journaled, and a single snapshot is written at the end.
+    Nothing is added to the watch history.
+    """
+    init_engine()
+    catalog_key = "movies" if media_type == "movie" else "tv_shows"
+    feature_key = "movie_features" if media_type == "movie" else "tv_features"
+    catalog = history_data.shared[catalog_key]
+    store = history_data.shared[feature_key]
+    report = {"added": 0, "skipped": 0, "errors": 0}
+
+    def apply(entries, errors):
+        report["errors"] += errors
+        with state_lock:
+            for title, info, features in entries:
+                if title in catalog:
+                    report["skipped"] += 1
+                    continue
+                catalog[title] = info
+                if features:
+                    store.add(title, features)
+                title_indexes[media_type].add(title)
+                report["added"] += 1
+
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = []
+        for chunk in _read_chunks(lines, chunk_size):
+            in_flight.append(executor.submit(_ingest_chunk, chunk, media_type))
+            if len(in_flight) >= 2 * workers:
+                apply(*in_flight.pop(0).result())
+        for future in in_flight:
+            apply(*future.result())
+
+    if report["added"]:
+        bump_state_version()
+        with instrumentation.stage("ingest.save"):
+            compact_data()
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def run_ingest_command(args):
+    """Run --ingest from the command line and print a summary to stderr"""
+    source = sys.stdin if args.ingest == "-" else open(args.ingest, "r")
+    try:
+        report = ingest_catalog(source, args.type, args.workers)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(f"Ingested {report['added']} {args.type} titles ({report['skipped']} already known, "
+          f"{report['errors']} unreadable) in {report['seconds']:.2f}s", file=sys.stderr)
+
+SERVICE_ENDPOINTS = {
+    "/movie": lambda params: search_movie(params["q"]),
+    "/tv": lambda params: search_tv_show(params["q"]),
+    "/people": lambda params: search_people(params["q"], params.get("role", "actor")),
+    "/genre": lambda params: search_genre(params["q"], params.get("type", "movie")),
+    "/recommendations": lambda params: get_personalized_recommendations(),
+}
+
+def handle_service_request(path, params):
+    """Run one service request; returns (HTTP status, JSON-ready body)"""
+    endpoint = SERVICE_ENDPOINTS.get(path)
+    if path == "/health":
+        return 200, {"status": "ok", "state_version": state_version}
+    if endpoint is None:
+        return 404, {"error": f"Unknown endpoint: {path}"}
+    if path != "/recommendations" and not params.get("q", "").strip():
+        return 400, {"error": "Missing query parameter 'q'"}
+    if path == "/people" and params.get("role", "actor") not in ("actor", "director"):
+        return 400, {"error": "role must be 'actor' or 'director'"}
+    if path == "/genre" and params.get("type", "movie") not in ("movie", "tv"):
+        return 400, {"error": "type must be 'movie' or 'tv'"}
+    try:
+        with use_profile(params.get("user") or DEFAULT_USER):
+            return 200, {"result": endpoint(params)}
+    except ValueError as e:
+        return 400, {"error": str(e)}
+
+def create_server(host=SERVE_HOST, port=SERVE_PORT, workers=SERVE_WORKERS):
+    """Build the HTTP service: one warm engine shared by a bounded pool of worker threads.
+
+    Connections are accepted on the server thread and handled on a
+    ThreadPoolExecutor; at most 4 * workers requests are queued before
+    accepting blocks.
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                status, body = handle_service_request(url.path.rstrip("/") or "/", params)
+            except Exception as e:
+                print(f"Error handling {url.path}: {str(e)}", file=sys.stderr)
+                status, body = 500, {"error": "Internal error"}
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    class PooledHTTPServer(HTTPServer):
+        def __init__(self, address):
+            super().__init__(address, ServiceHandler)
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+            self.slots = threading.BoundedSemaphore(workers * 4)
+
+        def process_request(self, request, client_address):
+            self.slots.acquire()
+            self.executor.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self.slots.release()
+
+        def server_close(self):
+            super().server_close()
+            self.executor.shutdown(wait=True)
+
+    return PooledHTTPServer((host, port))
+
+def serve(host=SERVE_HOST, port=SERVE_PORT, workers=SERVE_WORKERS, save_interval=SERVE_SAVE_INTERVAL):
+    """Run the HTTP service until interrupted.
+
+    The engine, genre cache and KNN models are loaded once up front.
+    Mutations from requests are journaled in memory and written to disk by
+    a background thread every save_interval seconds, then compacted on exit.
+    """
+    init_engine()
+    cache_genres()
+    for media_type in ("movie", "tv"):
+        build_knn_model(media_type)
+
+    server = create_server(host, port, workers)
+    stop = threading.Event()
+
+    def flush_periodically():
+        while not stop.wait(save_interval):
+            save_data(force=True)
+
+    flusher = threading.Thread(target=flush_periodically, daemon=True)
+    with deferred_saves():
+        flusher.start()
+        print(f"Serving on http://{host}:{server.server_address[1]} with {workers} workers", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            server.server_close()
+            flusher.join()
+    compact_data()
+
+def check_import_time(budget=IMPORT_TIME_BUDGET):
+    """Measure a cold import of this module in a fresh interpreter against a budget"""
+    import subprocess
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    code = ("import time; start = time.perf_counter(); import movieai; "
+            "print(time.perf_counter() - start)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=module_dir,
+                            capture_output=True, text=True, check=True)
+    elapsed = float(result.stdout.strip().splitlines()[-1])
+    return elapsed <= budget, elapsed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Media Recommendation Engine (Movies & TV Shows)")
+    parser.add_argument("--check-import-time", action="store_true",
+                        help=f"fail if importing the engine takes longer than {IMPORT_TIME_BUDGET}s")
+    parser.add_argument("--trace", choices=["trace", "histogram"], default=os.environ.get(TRACE_ENV_VAR),
+                        help="print a JSON trace per request, or latency histograms and counters on exit "
+                             f"(also settable through {TRACE_ENV_VAR})")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run lookups from FILE ('-' for stdin) instead of the interactive menu")
+    parser.add_argument("--output", metavar="FILE", default="-",
+                        help="where --batch writes JSON Lines results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="maximum concurrent lookups in --batch mode")
+    parser.add_argument("--ingest", metavar="FILE",
+                        help="bulk-load TMDb detail records (JSON Lines, '-' for stdin) into the catalog")
+    parser.add_argument("--type", choices=["movie", "tv"], default="movie",
+                        help="media type of the --ingest records")
+    parser.add_argument("--serve", action="store_true",
+                        help="run the local HTTP service instead of the interactive menu")
+    parser.add_argument("--host", default=SERVE_HOST, help="--serve bind address")
+    parser.add_argument("--port", type=int, default=SERVE_PORT, help="--serve port")
+    parser.add_argument("--build-neighbors", action="store_true",
+                        help="compute or refresh the precomputed KNN neighbor tables and exit")
+    parser.add_argument("--full", action="store_true",
+                        help="with --build-neighbors, rebuild the tables from scratch")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for --ingest and --build-neighbors (default: CPU count), "
+                             f"or worker threads for --serve (default: {SERVE_WORKERS})")
+    parser.add_argument("--prefetch", action="store_true", default=bool(os.environ.get(PREFETCH_ENV_VAR)),
+                        help="fetch details of recommended titles into the local catalog in the background "
+                             f"(also enabled by {PREFETCH_ENV_VAR})")
+    parser.add_argument("--user", default=DEFAULT_USER,
+                        help=f"profile to read and record history for (default: {DEFAULT_USER})")
+    return parser.parse_args(argv)
+
+def run_batch_command(args):
+    """Run --batch from the command line and print the throughput report to stderr"""
+    source = sys.stdin if args.batch == "-" else open(args.batch, "r")
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        report = run_batch(source, output, args.concurrency)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"Processed {report['queries']} queries ({report['unique_lookups']} unique) "
+          f"in {report['seconds']:.2f}s: {report['queries_per_second']:.1f} queries/s", file=sys.stderr)
+    print(f"Latency p50 {report['latency_p50_ms']:.1f}ms, p90 {report['latency_p90_ms']:.1f}ms, "
+          f"p99 {report['latency_p99_ms']:.1f}ms, max {report['latency_max_ms']:.1f}ms", file=sys.stderr)
+
 if __name__ == "__main__":
+    args = parse_args()
+    instrumentation.mode = args.trace or None
+    if args.check_import_time:
+        ok, elapsed = check_import_time()
+        print(f"Import time: {elapsed:.3f}s (budget {IMPORT_TIME_BUDGET}s)")
+        sys.exit(0 if ok else 1)
+    if args.prefetch:
+        enable_prefetch()
     try:
-        main()
+        with use_profile(args.user):
+            if args.serve:
+                serve(args.host, args.port, args.workers or SERVE_WORKERS)
+            elif args.build_neighbors:
+                for media_type in ("movie", "tv"):
+                    rows = build_neighbor_table(media_type, workers=args.workers, full=args.full)
+                    print(f"Neighbor table for {media_type}: {rows} rows computed", file=sys.stderr)
+            elif args.ingest:
+                run_ingest_command(args)
+            elif args.batch:
+                run_batch_command(args)
+            else:
+                main()
     except Exception as e:
-        print(f"Fatal error: {str(e)}")
\ No newline at end of file
+        print(f"Fatal error: {str(e)}")
+    finally:
+        disable_prefetch()
+        if instrumentation.mode == "histogram":
+            print(json.dumps(instrumentation.report(), indent=2), file=sys.stderr)
\ No newline at end of file
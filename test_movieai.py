@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+import movieai
+
+
+def make_index():
+    return movieai.TitleIndex([
+        "The Dark Knight Rises",
+        "Frozen II",
+        "Avatar",
+        "Gladiator",
+        "Rocky IV",
+        "Toy Story 3",
+        "Amélie",
+    ])
+
+
+def test_title_lookup_exact_and_normalized():
+    index = make_index()
+    assert index.lookup("Avatar") == "Avatar"
+    assert index.lookup("  amelie ") == "Amélie"
+    assert index.lookup("rocky iv") == "Rocky IV"
+
+
+def test_title_lookup_tolerates_typos():
+    index = make_index()
+    assert index.lookup("Avtar") == "Avatar"
+    assert index.lookup("Gladiatr") == "Gladiator"
+    assert index.lookup("Gladaitor") == "Gladiator"
+    assert index.lookup("The Dark Knigt Rises") == "The Dark Knight Rises"
+
+
+def test_title_lookup_never_resolves_a_prefix_to_a_longer_title():
+    index = make_index()
+    assert index.lookup("The Dark Knight") is None
+    assert index.lookup("Frozen") is None
+    assert index.lookup("Toy Story") is None
+
+
+def test_title_lookup_never_resolves_to_a_sequel():
+    index = make_index()
+    assert index.lookup("Rocky III") is None
+    assert index.lookup("Rocky V") is None
+    assert index.lookup("Frozen III") is None
+    assert index.lookup("Toy Story 2") is None
+
+
+def test_title_lookup_short_queries_match_exactly_only():
+    index = movieai.TitleIndex(["Us"])
+    assert index.lookup("us") == "Us"
+    assert index.lookup("Up") is None
+
+
+def test_import_time_budget():
+    ok, elapsed = movieai.check_import_time()
+    assert ok, f"importing movieai took {elapsed:.3f}s (budget {movieai.IMPORT_TIME_BUDGET}s)"
+
+
+def test_import_does_not_load_heavy_dependencies():
+    code = ("import sys, movieai; "
+            "print(','.join(m for m in ('numpy', 'pandas', 'sklearn', 'mlxtend', 'requests') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(movieai.__file__)),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""